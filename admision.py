@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Control de admisión para /buscar. Cada búsqueda llega con un costo estimado en ms de CPU
+# (MotorBaterias.costo_estimado) y pasa por dos filtros:
+#   - un cubo de tokens por cliente: cada cliente acumula hasta `capacidad_ms` y recupera
+#     `recarga_ms_por_s`; una búsqueda se admite si le alcanzan los tokens para su costo, así
+#     un cliente insistente se frena sin afectar a los demás;
+#   - un cupo global de búsquedas pesadas (costo >= `umbral_pesada_ms`) ejecutándose a la vez,
+#     para que unas pocas búsquedas caras no dejen sin CPU al resto.
+# Si no se admite, se responde 429 con los segundos que conviene esperar. Los endpoints de
+# facetas, el snapshot y las búsquedas ya en caché no pasan por aquí.
+class ControlAdmision:
+    def __init__(self, capacidad_ms, recarga_ms_por_s, umbral_pesada_ms, max_pesadas,
+                 espera_pesada_s=0.0, max_clientes=10000):
+        self.capacidad_ms = capacidad_ms
+        self.recarga_ms_por_s = recarga_ms_por_s
+        self.umbral_pesada_ms = umbral_pesada_ms
+        self.max_pesadas = max_pesadas
+        self.espera_pesada_s = espera_pesada_s
+        self.max_clientes = max_clientes
+        self.admitidas = 0
+        self.rechazadas_cliente = 0
+        self.rechazadas_pesadas = 0
+        # cliente -> (tokens, instante de la última recarga), en orden LRU para acotar memoria
+        self._cubos = OrderedDict()
+        self._pesadas = threading.BoundedSemaphore(max_pesadas)
+        self._pesadas_activas = 0
+        self._lock = threading.Lock()
+
+    def _consumir(self, cliente, costo):
+        # Un costo mayor que la capacidad se cobra como la capacidad: si no, esa búsqueda no se
+        # admitiría nunca
+        costo = min(costo, self.capacidad_ms)
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, instante = self._cubos.pop(cliente, (self.capacidad_ms, ahora))
+            tokens = min(self.capacidad_ms, tokens + (ahora - instante) * self.recarga_ms_por_s)
+            if tokens >= costo:
+                tokens -= costo
+                espera = 0
+            else:
+                espera = max(1, math.ceil((costo - tokens) / self.recarga_ms_por_s)) if self.recarga_ms_por_s > 0 else 60
+            self._cubos[cliente] = (tokens, ahora)
+            while len(self._cubos) > self.max_clientes:
+                self._cubos.popitem(last=False)
+        return espera
+
+    # Devuelve (admitida, segundos para reintentar, pesada); si se admitió una pesada hay que
+    # llamar a liberar(True) al terminar
+    def admitir(self, cliente, costo):
+        pesada = costo >= self.umbral_pesada_ms
+        if pesada:
+            if self.espera_pesada_s > 0:
+                obtenida = self._pesadas.acquire(timeout=self.espera_pesada_s)
+            else:
+                obtenida = self._pesadas.acquire(blocking=False)
+            if not obtenida:
+                with self._lock:
+                    self.rechazadas_pesadas += 1
+                return False, 1, pesada
+            with self._lock:
+                self._pesadas_activas += 1
+
+        espera = self._consumir(cliente, costo)
+        if espera:
+            if pesada:
+                self.liberar(True)
+            with self._lock:
+                self.rechazadas_cliente += 1
+            return False, espera, pesada
+
+        with self._lock:
+            self.admitidas += 1
+        return True, 0, pesada
+
+    def liberar(self, pesada):
+        if pesada:
+            with self._lock:
+                self._pesadas_activas -= 1
+            self._pesadas.release()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'clientes': len(self._cubos),
+                'pesadas_activas': self._pesadas_activas,
+                'max_pesadas': self.max_pesadas,
+                'admitidas': self.admitidas,
+                'rechazadas_cliente': self.rechazadas_cliente,
+                'rechazadas_pesadas': self.rechazadas_pesadas,
+            }
@@ -1,11 +1,18 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import pandas as pd
 import os
 import sys
 import logging
-import re
-from difflib import SequenceMatcher
-from math import ceil
+import json
+import gzip
+import time
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él las respuestas se comprimen solo con gzip
+    brotli = None
 
 # Configurar logging (para mostrar peticiones)
 logging.basicConfig(level=logging.DEBUG)
@@ -26,377 +33,433 @@ except Exception as e:
     BASE_DIR = os.getcwd()
     RUTA_EXCEL = os.path.join(BASE_DIR, "DuracionBateriasAG.xlsx")
 
-# Funciones auxiliares para evitar dependencias de calc11.py
-def _try_float(x):
-    try:
-        return float(str(x).replace(",", ".").strip())
-    except:
-        return 0
-
-def _norm(s: str) -> str:
-    s = (s or "").strip().lower()
-    rep = {"á":"a","é":"e","í":"i","ó":"o","ú":"u","ü":"u","ñ":"n"}
-    for k,v in rep.items():
-        s = s.replace(k,v)
-    return s
-
-def _norm_avanzada(s: str) -> str:
-    s = (s or "").strip().lower()
-    rep = {"á":"a","é":"e","í":"i","ó":"o","ú":"u","ü":"u","ñ":"n"}
-    for k,v in rep.items():
-        s = s.replace(k,v)
-    
-    # Eliminar palabras de conexión comunes
-    palabras_conexion = {
-        'de', 'del', 'la', 'el', 'y', 'en', 'a', 'para', 'por', 'con', 'sin', 
-        'sobre', 'bajo', 'entre', 'hacia', 'desde', 'hasta', 'mediante', 'según',
-        'como', 'que', 'cuando', 'donde', 'cual', 'quien', 'cuyo', 'cuyas', 'cuyos',
-        'unas', 'unos', 'una', 'un', 'lo', 'los', 'las', 'al', 'se', 'su', 'sus',
-        'este', 'esta', 'estos', 'estas', 'ese', 'esa', 'esos', 'esas', 'aquel',
-        'aquella', 'aquellos', 'aquellas', 'otro', 'otra', 'otros', 'otras',
-        'mismo', 'misma', 'mismos', 'mismas', 'todo', 'toda', 'todos', 'todas',
-        'cada', 'cualquier', 'cualesquiera', 'varios', 'varias', 'ambos', 'ambas',
-        'etc', 'etcétera', 'entre otros', 'entre otras', 'para que', 'de la', 'de los',
-        'de las', 'en la', 'en el', 'a la', 'al', 'del', 'y las', 'y los', 'y la', 'y el'
-    }
-    
-    # Eliminar caracteres especiales y dividir en palabras
-    s = re.sub(r'[^\w\s]', ' ', s)
-    palabras = re.findall(r'\b[a-z0-9]+\b', s)
-    
-    # Filtrar palabras de conexión y palabras muy cortas sin significado
-    palabras_filtradas = [p for p in palabras if p not in palabras_conexion and len(p) > 2]
-    
-    return ' '.join(palabras_filtradas)
-
-def _calcular_similitud(a: str, b: str) -> float:
-    if not a or not b:
-        return 0.0
-    return SequenceMatcher(None, a, b).ratio()
+from admision import ControlAdmision
+
+# Motor de búsqueda compartido con calc11.py
+from motor_baterias import (
+    MotorBaterias,
+    ConsultaBaterias,
+    CacheVersionada,
+    leer_numero,
+    normalizar_texto,
+    normalizar_uso,
+    a_float64,
+    buscar_columna_aplicacion,
+    COLUMNAS_USO_ADICIONALES,
+)
+
+def _megabytes(variable, por_defecto):
+    return int(float(os.environ.get(variable, por_defecto)) * 1024 * 1024)
+
+# Catálogo en memoria y sus cachés (etapas del pipeline, respuestas de /buscar y facetas). La
+# versión del catálogo es (mtime, tamaño) del Excel y de db.json: si cualquiera cambia se vuelve
+# a armar el catálogo y las cachés se invalidan.
+motor = MotorBaterias(
+    RUTA_EXCEL,
+    cache_etapas_bytes=_megabytes('CACHE_ETAPAS_MB', 32),
+    cache_resultados_bytes=_megabytes('CACHE_RESULTADOS_MB', 16),
+    cache_facetas_bytes=_megabytes('CACHE_FACETAS_MB', 4),
+)
 
-def _buscar_coincidencias(texto: str, busqueda: str, umbral=0.7) -> bool:
-    if not texto or not busqueda:
-        return False
-    
-    texto_norm = _norm_avanzada(texto)
-    busqueda_norm = _norm_avanzada(busqueda)
-    
-    if not texto_norm or not busqueda_norm:
-        return False
-    
-    def dividir_terminos(texto):
-        separadores = [',', ';', '/', '|', ' y ', ' e ']
-        texto_para_dividir = texto
-        for sep in separadores:
-            texto_para_dividir = texto_para_dividir.replace(sep, ',')
-        return [t.strip() for t in texto_para_dividir.split(',') if t.strip()]
-    
-    terminos_texto = dividir_terminos(texto_norm)
-    terminos_busqueda = dividir_terminos(busqueda_norm)
-    
-    for termino_b in terminos_busqueda:
-        for termino_t in terminos_texto:
-            if termino_b in termino_t:
-                return True
-            similitud = _calcular_similitud(termino_b, termino_t)
-            if similitud >= umbral:
-                return True
-    
-    if busqueda_norm in texto_norm:
-        return True
-    
-    similitud_completa = _calcular_similitud(texto_norm, busqueda_norm)
-    return similitud_completa >= umbral
+app = Flask(__name__)
 
-# Función para cargar catálogo
-def cargar_catalogo_baterias(ruta_excel, hoja="Baterias"):
+# Control de admisión de /buscar (ver admision.py). Los costos son ms de CPU estimados por
+# MotorBaterias.costo_estimado; el cliente es la IP que agregó el último de PROXIES_CONFIABLES
+# proxies en X-Forwarded-For, o la IP de la conexión. Por defecto no se confía en el encabezado
+# (un cliente sin proxy delante podría rotarlo para estrenar cubos); render.yaml fija 1 porque
+# Render agrega un proxy.
+admision = ControlAdmision(
+    capacidad_ms=float(os.environ.get('ADMISION_CAPACIDAD_MS', 2000)),
+    recarga_ms_por_s=float(os.environ.get('ADMISION_RECARGA_MS_POR_S', 250)),
+    umbral_pesada_ms=float(os.environ.get('ADMISION_UMBRAL_PESADA_MS', 50)),
+    max_pesadas=int(os.environ.get('ADMISION_MAX_PESADAS', 2)),
+    espera_pesada_s=float(os.environ.get('ADMISION_ESPERA_PESADA_S', 0.5)),
+)
+PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', 0))
+
+def _cliente():
+    reenviado = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+    if PROXIES_CONFIABLES > 0 and len(reenviado) >= PROXIES_CONFIABLES:
+        return reenviado[-PROXIES_CONFIABLES]
+    return request.remote_addr or ''
+
+# Registro de tráfico: si REGISTRO_BUSQUEDAS apunta a un archivo, cada cuerpo recibido en
+# /buscar se agrega como una línea JSON (el formato que leen CONSULTAS_CALENTAMIENTO y carga.py)
+RUTA_REGISTRO_BUSQUEDAS = os.environ.get('REGISTRO_BUSQUEDAS', '').strip()
+_registro_lock = threading.Lock()
+
+def registrar_busqueda(data):
+    if not RUTA_REGISTRO_BUSQUEDAS:
+        return
+    linea = json.dumps(data, ensure_ascii=False, sort_keys=True) + '\n'
     try:
-        df = pd.read_excel(ruta_excel, sheet_name=hoja, dtype=str)
-    except Exception as e:
-        logger.error(f"[ERROR] No se pudo leer el archivo '{ruta_excel}': {e}")
-        return pd.DataFrame()
-
-    # Normalizar los nombres de las columnas
-    df.columns = (
-        df.columns.str.strip()
-        .str.lower()
-        .str.replace(r"[\s\-/]+","_",regex=True)
-        .str.replace(r"[()]","",regex=True)
-    )
-
-    # Convertir valores numéricos
-    for col in ['voltaje_v','corriente_ah','capacidad_bateria_wh']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(r"[^0-9.\-]","",regex=True), errors='coerce')
-
-    # Eliminar filas donde todos los valores numéricos importantes son NaN
-    columnas_numericas = [c for c in ['voltaje_v','corriente_ah','capacidad_bateria_wh'] if c in df.columns]
-    if columnas_numericas:
-        df = df.dropna(subset=columnas_numericas, how='all')
-
-    return df
-
-# Función de cálculo de baterías (versión simplificada y robusta)
-def calcular_baterias(cat: pd.DataFrame, voltaje=0, corriente=0, capacidad=0,
-                      tipo_bateria="", aplicacion="", autonomia_horas=0, potencia_carga=0,
-                      permitir_arreglos=False, umbral_similitud=0.6):
-    
-    logger.info(f"🔧 Iniciando cálculo: voltaje={voltaje}V, corriente={corriente}A, capacidad={capacidad}Wh, arreglos={permitir_arreglos}")
-    
-    datos = cat.copy()
-    if datos.empty:
-        logger.warning("❌ Catálogo vacío")
-        return pd.DataFrame()
-
-    # Crear columna de capacidad si no existe
-    if 'capacidad_bateria_wh' not in datos.columns and 'voltaje_v' in datos.columns and 'corriente_ah' in datos.columns:
-        datos['capacidad_bateria_wh'] = datos['voltaje_v'] * datos['corriente_ah']
-
-    # Filtro por tipo
-    if tipo_bateria and 'tipo' in datos.columns:
-        tipo_busqueda = _norm(tipo_bateria)
-        datos['tipo_norm'] = datos['tipo'].astype(str).apply(_norm)
-        datos = datos[datos['tipo_norm'] == tipo_busqueda]
-        logger.info(f"🔧 Filtrado por tipo '{tipo_bateria}': {len(datos)} baterías")
-
-    # Filtro por aplicación
-    if aplicacion and aplicacion.strip():
-        columnas_aplicacion = ['uso', 'aplicacion', 'aplicaciones']
-        columna_encontrada = None
-        
-        for col in columnas_aplicacion:
-            if col in datos.columns:
-                columna_encontrada = col
-                break
-        
-        if columna_encontrada:
-            def aplicar_filtro_aplicacion(fila):
-                uso_valor = fila[columna_encontrada] if pd.notna(fila[columna_encontrada]) else ''
-                return _buscar_coincidencias(str(uso_valor), aplicacion, umbral=umbral_similitud)
-            
-            mask = datos.apply(aplicar_filtro_aplicacion, axis=1)
-            datos = datos[mask]
-            logger.info(f"🔧 Filtrado por aplicación '{aplicacion}': {len(datos)} baterías")
-
-    # Calcular capacidad requerida
-    capacidad_requerida = capacidad
-    if autonomia_horas > 0 and potencia_carga > 0:
-        capacidad_requerida = autonomia_horas * potencia_carga
-    elif capacidad == 0 and voltaje > 0 and corriente > 0:
-        capacidad_requerida = voltaje * corriente
-
-    logger.info(f"🔧 Capacidad requerida: {capacidad_requerida}Wh")
-
-    # Margen de búsqueda
-    parametros_numericos = sum(1 for x in [voltaje, corriente, capacidad_requerida] if x > 0)
-    margen = 0.5 if parametros_numericos <= 1 else 0.3
-
-    # LÓGICA DE ARREGLOS
-    resultados_finales = []
-    
-    if permitir_arreglos:
-        logger.info("🔧 Modo arreglos ACTIVADO")
-        
-        for _, bat in datos.iterrows():
-            v_individual = bat['voltaje_v'] if 'voltaje_v' in bat and pd.notna(bat['voltaje_v']) else 0
-            a_individual = bat['corriente_ah'] if 'corriente_ah' in bat and pd.notna(bat['corriente_ah']) else 0
-            
-            if v_individual <= 0 or a_individual <= 0:
-                continue
-            
-            # Calcular configuraciones
-            n_serie = 1
-            n_paralelo = 1
-            
-            if voltaje > 0 and v_individual > 0:
-                n_serie = max(1, ceil(voltaje / v_individual))
-            
-            if corriente > 0 and a_individual > 0:
-                n_paralelo = max(1, ceil(corriente / a_individual))
-            
-            # Calcular valores totales
-            voltaje_total = v_individual * n_serie
-            corriente_total = a_individual * n_paralelo
-            capacidad_total = voltaje_total * corriente_total
-            
-            # Crear batería con arreglo
-            bateria_con_arreglo = bat.copy()
-            bateria_con_arreglo['n_serie'] = n_serie
-            bateria_con_arreglo['n_paralelo'] = n_paralelo
-            bateria_con_arreglo['voltaje_total_v'] = voltaje_total
-            bateria_con_arreglo['corriente_total_ah'] = corriente_total
-            bateria_con_arreglo['capacidad_total_wh'] = capacidad_total
-            bateria_con_arreglo['es_arreglo'] = n_serie > 1 or n_paralelo > 1
-            
-            resultados_finales.append(bateria_con_arreglo)
-            
-        logger.info(f"🔧 Generados {len(resultados_finales)} arreglos")
-        
-    else:
-        logger.info("🔧 Modo arreglos DESACTIVADO")
-        for _, bat in datos.iterrows():
-            bateria_individual = bat.copy()
-            bateria_individual['n_serie'] = 1
-            bateria_individual['n_paralelo'] = 1
-            bateria_individual['voltaje_total_v'] = bateria_individual.get('voltaje_v', 0)
-            bateria_individual['corriente_total_ah'] = bateria_individual.get('corriente_ah', 0)
-            bateria_individual['capacidad_total_wh'] = bateria_individual.get('voltaje_v', 0) * bateria_individual.get('corriente_ah', 0)
-            bateria_individual['es_arreglo'] = False
-            resultados_finales.append(bateria_individual)
-    
-    if not resultados_finales:
-        logger.warning("❌ No hay resultados después de procesar arreglos")
-        return pd.DataFrame()
+        with _registro_lock, open(RUTA_REGISTRO_BUSQUEDAS, 'a', encoding='utf-8') as f:
+            f.write(linea)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo registrar la búsqueda: {e}")
+
+# Respuesta de /buscar (desde la caché de resultados del motor o armada con _armar_respuesta)
+def _respuesta_busqueda(consulta: ConsultaBaterias):
+    cat, _ = motor.catalogo()
+    if cat.empty:
+        return {'success': False, 'error': 'No se pudo cargar el catálogo de baterías'}
+    return motor.respuesta(consulta, _armar_respuesta)
+
+def _armar_respuesta(resultado):
+    consulta = resultado.consulta
+    res = resultado.baterias
+
+    if res.empty:
+        respuesta = {'success': True, 'resultados': [], 'total': 0}
+        if consulta.optimizar_banco:
+            respuesta['bancos'] = resultado.bancos
+        return respuesta
+
+    # Construir respuesta
+    resultados = []
+    for _, bateria in res.iterrows():
+        numero_parte = (
+            bateria.get('no_de_parte') or 
+            bateria.get('no._de_parte') or 
+            bateria.get('numero_parte') or
+            'N/A'
+        )
         
-    datos = pd.DataFrame(resultados_finales)
+        aplicaciones = (
+            bateria.get('uso') or 
+            bateria.get('aplicacion') or 
+            bateria.get('aplicaciones') or
+            'N/A'
+        )
 
-    # Filtrar por rangos
-    datos_filtrados = datos.copy()
-    
-    if voltaje > 0 and 'voltaje_total_v' in datos_filtrados.columns:
-        rango_min_voltaje = voltaje * (1 - margen)
-        rango_max_voltaje = voltaje * (1 + margen)
-        datos_filtrados = datos_filtrados[
-            datos_filtrados['voltaje_total_v'].between(rango_min_voltaje, rango_max_voltaje)
-        ]
-        logger.info(f"🔧 Filtro voltaje: {len(datos_filtrados)} después de filtrar")
-    
-    if corriente > 0 and 'corriente_total_ah' in datos_filtrados.columns:
-        rango_min_corriente = corriente * (1 - margen)
-        rango_max_corriente = corriente * (1 + margen)
-        datos_filtrados = datos_filtrados[
-            datos_filtrados['corriente_total_ah'].between(rango_min_corriente, rango_max_corriente)
-        ]
-        logger.info(f"🔧 Filtro corriente: {len(datos_filtrados)} después de filtrar")
-    
-    if capacidad_requerida > 0 and 'capacidad_total_wh' in datos_filtrados.columns:
-        rango_min_capacidad = capacidad_requerida * (1 - margen)
-        rango_max_capacidad = capacidad_requerida * (1 + margen)
-        datos_filtrados = datos_filtrados[
-            datos_filtrados['capacidad_total_wh'].between(rango_min_capacidad, rango_max_capacidad)
-        ]
-        logger.info(f"🔧 Filtro capacidad: {len(datos_filtrados)} después de filtrar")
-
-    if datos_filtrados.empty:
-        logger.warning("❌ No hay resultados después del filtrado")
-        return pd.DataFrame()
-
-    # Ordenamiento
-    if 'capacidad_total_wh' in datos_filtrados.columns:
-        datos_filtrados['diff_capacidad'] = abs(datos_filtrados['capacidad_total_wh'] - capacidad_requerida)
-    if 'voltaje_total_v' in datos_filtrados.columns:
-        datos_filtrados['diff_voltaje'] = abs(datos_filtrados['voltaje_total_v'] - voltaje)
-    
-    columnas_orden = []
-    if 'diff_capacidad' in datos_filtrados.columns:
-        columnas_orden.append('diff_capacidad')
-    if 'diff_voltaje' in datos_filtrados.columns:
-        columnas_orden.append('diff_voltaje')
-    
-    if columnas_orden:
-        res = datos_filtrados.sort_values(by=columnas_orden)
-    else:
-        res = datos_filtrados
+        resultados.append({
+            'tipo': bateria.get('tipo', 'N/A'),
+            'numero_parte': numero_parte,
+            'voltaje': bateria.get('voltaje_v', 0),
+            'corriente': bateria.get('corriente_ah', 0),
+            'capacidad_wh': bateria.get('capacidad_individual_wh', 0),
+            'aplicaciones': aplicaciones,
+            'n_serie': int(bateria.get('n_serie', 1)),
+            'n_paralelo': int(bateria.get('n_paralelo', 1)),
+            'voltaje_total': bateria.get('voltaje_total_v', 0),
+            'corriente_total': bateria.get('corriente_total_ah', 0),
+            'capacidad_total': bateria.get('capacidad_total_wh', 0),
+            'es_arreglo': bool(bateria.get('es_arreglo', False))
+        })
 
-    # Limpiar columnas auxiliares
-    res = res.drop(columns=['diff_capacidad','diff_voltaje', 'uso_norm', 'tipo_norm'], errors='ignore')
-    
-    # Calcular capacidad individual
-    if 'voltaje_v' in res.columns and 'corriente_ah' in res.columns:
-        res['capacidad_individual_wh'] = res['voltaje_v'] * res['corriente_ah']
+    respuesta = {
+        'success': True,
+        'resultados': resultados,
+        'total': len(resultados),
+        'capacidad_calculada': consulta.capacidad_calculada,
+        'permitir_arreglos': consulta.permitir_arreglos
+    }
+    # Bancos que combinan varios modelos (solo si se piden con optimizar_banco)
+    if consulta.optimizar_banco:
+        respuesta['bancos'] = resultado.bancos
+    return respuesta
+
+# Términos de aplicación normalizados de una columna de usos (para los selects del formulario)
+def _terminos_aplicacion(usos):
+    aplicaciones_set = set()
+    for uso in usos.dropna().unique():
+        uso_str = str(uso).strip()
+        separadores = [',', ';', '/', '|', ' y ', ' e ']
+        for sep in separadores:
+            uso_str = uso_str.replace(sep, ',')
+        terminos = uso_str.split(',')
+        for termino in terminos:
+            termino_limpio = termino.strip()
+            if termino_limpio:
+                termino_normalizado = normalizar_uso(termino_limpio)
+                if termino_normalizado and len(termino_normalizado) > 2:
+                    aplicaciones_set.add(termino_normalizado)
+    return sorted([a for a in aplicaciones_set if a and len(a) > 2])
+
+def _filtrar_por_tipo(cat, tipo_bateria):
+    tipo_normalizado = normalizar_texto(tipo_bateria)
+    if 'tipo_norm' not in cat.columns:
+        cat = cat.copy()
+        cat['tipo_norm'] = cat['tipo'].astype(str).apply(normalizar_texto)
+    return cat[cat['tipo_norm'] == tipo_normalizado]
+
+def _payload_tipos(cat):
+    if 'tipo' in cat.columns:
+        tipos = cat['tipo'].dropna().apply(normalizar_texto).unique().tolist()
+        tipos = sorted([t for t in tipos if t and t.strip()])
+    else:
+        tipos = []
+    return {'success': True, 'tipos': tipos}
+
+# Incluye los términos de los usos adicionales (db.json), que también se consultan al buscar
+def _payload_aplicaciones(cat):
+    columna_encontrada = buscar_columna_aplicacion(cat)
+    aplicaciones = []
+    if columna_encontrada:
+        columnas = [columna_encontrada] + [c for c in COLUMNAS_USO_ADICIONALES if c in cat.columns]
+        aplicaciones = _terminos_aplicacion(pd.concat([cat[c].astype(object) for c in columnas]))
+    return {'success': True, 'aplicaciones': aplicaciones}
+
+def _payload_aplicaciones_por_tipo(cat, tipo_bateria):
+    if cat.empty or 'tipo' not in cat.columns:
+        return {'success': False, 'aplicaciones': []}
+    return _payload_aplicaciones(_filtrar_por_tipo(cat, tipo_bateria))
+
+def _lista_voltajes(cat):
+    voltajes = a_float64(cat['voltaje_v'].dropna().unique())
+    return sorted([v for v in voltajes if v is not None and v > 0])
+
+def _payload_voltajes_por_tipo(cat, tipo_bateria):
+    if cat.empty or 'tipo' not in cat.columns or 'voltaje_v' not in cat.columns:
+        return {'success': False, 'voltajes': []}
+    return {'success': True, 'voltajes': _lista_voltajes(_filtrar_por_tipo(cat, tipo_bateria))}
+
+def _payload_todos_los_voltajes(cat):
+    if cat.empty or 'voltaje_v' not in cat.columns:
+        return {'success': False, 'voltajes': []}
+    return {'success': True, 'voltajes': _lista_voltajes(cat)}
+
+# Compresión de respuestas según Accept-Encoding (br si está instalado, si no gzip)
+def _elegir_codificacion():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def _comprimir(cuerpo: bytes, codificacion: str, calidad_br: int = 11) -> bytes:
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=calidad_br)
+    if codificacion == 'gzip':
+        return gzip.compress(cuerpo, compresslevel=6)
+    return cuerpo
+
+# Identificador corto y estable de una versión del catálogo, para URLs y ETags
+def _version_texto(version):
+    return hashlib.sha1(repr((FORMATO_SNAPSHOT, version)).encode('utf-8')).hexdigest()[:16]
+
+# Huella de una búsqueda: misma versión del catálogo y misma consulta canónica dan la misma
+# respuesta, así que sirve de ETag sin tener que calcularla
+FORMATO_BUSQUEDA = 1
+
+def _huella_busqueda(version, consulta: ConsultaBaterias):
+    return hashlib.sha1(repr((FORMATO_BUSQUEDA, version, consulta.canonica())).encode('utf-8')).hexdigest()[:20]
+
+# Respuestas de /buscar: se comprimen desde UMBRAL_COMPRESION_BYTES (las búsquedas con arreglos
+# repiten aplicaciones y números en cada fila) y llevan ETag = huella + codificación. Se usa un
+# nivel de brotli bajo porque se comprime una vez por búsqueda distinta y no una vez por versión
+# como el snapshot. Los cuerpos ya serializados y comprimidos se guardan por (huella, codificación
+# pedida), igual que las variantes del snapshot: un POST repetido (que no puede usar 304) se
+# envía sin volver a serializar ni comprimir.
+UMBRAL_COMPRESION_BYTES = int(os.environ.get('UMBRAL_COMPRESION_BYTES', 1024))
+CALIDAD_BR_BUSQUEDA = int(os.environ.get('CALIDAD_BR_BUSQUEDA', 5))
+cache_codificadas = CacheVersionada(max_bytes=_megabytes('CACHE_CODIFICADAS_MB', 8))
+
+def _codificada_en_cache(version, huella, codificacion):
+    if not huella:
+        return False
+    cache_codificadas.sincronizar(version)
+    return cache_codificadas.contiene((huella, codificacion), version)
+
+# (cuerpo, codificación aplicada, éxito) de la búsqueda; solo se guardan las respuestas exitosas
+def _cuerpo_busqueda(consulta: ConsultaBaterias, version, huella, codificacion):
+    clave = (huella, codificacion)
+    if huella:
+        cache_codificadas.sincronizar(version)
+        guardado = cache_codificadas.obtener(clave, version)
+        if guardado is not None:
+            return guardado
+
+    datos = _respuesta_busqueda(consulta)
+    cuerpo = jsonify(datos).data
+    aplicada = codificacion if len(cuerpo) >= UMBRAL_COMPRESION_BYTES else 'identity'
+    if aplicada != 'identity':
+        cuerpo = _comprimir(cuerpo, aplicada, CALIDAD_BR_BUSQUEDA)
+    guardado = (cuerpo, aplicada, bool(datos.get('success')))
+    if huella and guardado[2]:
+        cache_codificadas.guardar(clave, guardado, version)
+    return guardado
+
+def _respuesta_comprimida(consulta: ConsultaBaterias, version, huella, codificacion):
+    cuerpo, codificacion, exito = _cuerpo_busqueda(consulta, version, huella, codificacion)
+    respuesta = Response(cuerpo, mimetype='application/json')
+    if codificacion != 'identity':
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.headers['Vary'] = 'Accept-Encoding'
+    if huella and exito:
+        respuesta.set_etag(f"{huella}-{codificacion}")
+        respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+# Snapshot del catálogo para el modo de búsqueda en el navegador. Columnar y con los textos
+# codificados como diccionario (valores únicos + códigos por fila), igual que el catálogo
+# compacto. Incluye los usos ya normalizados (para no depender de portar normalizar_uso sobre
+# el catálogo) y las respuestas de los endpoints de facetas. Si el catálogo supera
+# LIMITE_FILAS_SNAPSHOT, el snapshot solo indica modo 'servidor' y la página usa /buscar.
+FORMATO_SNAPSHOT = 2
+LIMITE_FILAS_SNAPSHOT = int(os.environ.get('LIMITE_FILAS_SNAPSHOT', 20000))
+
+_snapshot = {'version': None, 'variantes': {}}
+_snapshot_lock = threading.Lock()
+
+def _columna_diccionario(serie):
+    if not pd.api.types.is_categorical_dtype(serie):
+        serie = serie.astype('category')
+    return {
+        'valores': [str(v) for v in serie.cat.categories],
+        'codigos': serie.cat.codes.to_numpy().tolist(),
+    }
 
-    logger.info(f"✅ Resultados finales: {len(res)} baterías/arreglos")
-    return res.reset_index(drop=True)
+def _columna_numerica(serie):
+    return [None if pd.isna(v) else float(v) for v in a_float64(serie.to_numpy())]
+
+# Primer valor no vacío por fila entre varias columnas (como bateria.get(a) or bateria.get(b) ...)
+def _primera_columna(cat, columnas):
+    valores = [None] * len(cat)
+    for col in reversed([c for c in columnas if c in cat.columns]):
+        for i, v in enumerate(cat[col].tolist()):
+            if pd.notna(v) and v != '':
+                valores[i] = str(v)
+    return valores
+
+def _construir_snapshot(cat, version):
+    version_txt = _version_texto(version)
+    if cat.empty or len(cat) > LIMITE_FILAS_SNAPSHOT or 'voltaje_v' not in cat.columns or 'corriente_ah' not in cat.columns:
+        return {'success': True, 'modo': 'servidor', 'version': version_txt, 'total': len(cat)}
+
+    columnas = {
+        'tipo': _primera_columna(cat, ['tipo']),
+        'numero_parte': _primera_columna(cat, ['no_de_parte', 'no._de_parte', 'numero_parte']),
+        'aplicaciones': _primera_columna(cat, ['uso', 'aplicacion', 'aplicaciones']),
+        'voltaje_v': _columna_numerica(cat['voltaje_v']),
+        'corriente_ah': _columna_numerica(cat['corriente_ah']),
+    }
+    if 'tipo_norm' in cat.columns:
+        columnas['tipo_norm'] = _columna_diccionario(cat['tipo_norm'])
+    columna_aplicacion = buscar_columna_aplicacion(cat)
+    if columna_aplicacion:
+        columnas['aplicacion_norm'] = _columna_diccionario(cat[f"{columna_aplicacion}_norm"])
+        if 'usos_db_norm' in cat.columns:
+            columnas['usos_db_norm'] = _columna_diccionario(cat['usos_db_norm'])
+
+    tipos = motor.faceta('tipos', _payload_tipos)['tipos']
+    facetas = {
+        'tipos': tipos,
+        'aplicaciones': motor.faceta('aplicaciones', _payload_aplicaciones)['aplicaciones'],
+        'todos_los_voltajes': motor.faceta('todos_los_voltajes', _payload_todos_los_voltajes)['voltajes'],
+        'aplicaciones_por_tipo': {t: motor.faceta('aplicaciones_por_tipo', _payload_aplicaciones_por_tipo, t)['aplicaciones'] for t in tipos},
+        'voltajes_por_tipo': {t: motor.faceta('voltajes_por_tipo', _payload_voltajes_por_tipo, t)['voltajes'] for t in tipos},
+    }
+    return {
+        'success': True,
+        'modo': 'local',
+        'version': version_txt,
+        'total': len(cat),
+        'columnas': columnas,
+        'facetas': facetas,
+    }
 
-app = Flask(__name__)
+# Snapshot serializado y comprimido una sola vez por versión del catálogo
+def obtener_snapshot():
+    cat, version = motor.catalogo()
+    with _snapshot_lock:
+        if _snapshot['version'] != version or not _snapshot['variantes']:
+            datos = _construir_snapshot(cat, version)
+            cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            variantes = {'identity': cuerpo, 'gzip': _comprimir(cuerpo, 'gzip')}
+            if brotli is not None:
+                variantes['br'] = _comprimir(cuerpo, 'br')
+            _snapshot.update(version=version, version_texto=datos['version'], variantes=variantes)
+            logger.info(f"📦 Snapshot del catálogo: {len(cuerpo)} bytes, gzip {len(variantes['gzip'])} bytes")
+        return _snapshot['version_texto'], _snapshot['variantes']
 
 # Página principal
 @app.route('/')
 def index():
-    return render_template('index3.html')
+    try:
+        version_snapshot, _ = obtener_snapshot()
+    except Exception as e:
+        logger.error(f"Error preparando el snapshot del catálogo: {e}")
+        version_snapshot = ''
+    return render_template('index3.html', version_catalogo=version_snapshot)
+
+# Snapshot del catálogo para filtrar en el navegador. Con ?v=<versión actual> se puede
+# guardar indefinidamente en caché (la URL cambia con cada versión del catálogo); sin ella
+# se revalida con ETag.
+@app.route('/catalogo-snapshot')
+def catalogo_snapshot():
+    try:
+        version_snapshot, variantes = obtener_snapshot()
+        codificacion = _elegir_codificacion()
+        etag = f"{version_snapshot}-{codificacion}"
 
-# Endpoints de la API
-@app.route('/buscar', methods=['POST'])
+        if request.args.get('v') == version_snapshot:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'no-cache'
+
+        if request.if_none_match.contains(etag):
+            respuesta = Response(status=304)
+        else:
+            respuesta = Response(variantes[codificacion], mimetype='application/json')
+            if codificacion != 'identity':
+                respuesta.headers['Content-Encoding'] = codificacion
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = cache_control
+        respuesta.headers['Vary'] = 'Accept-Encoding'
+        return respuesta
+    except Exception as e:
+        logger.error(f"Error generando el snapshot del catálogo: {e}")
+        return jsonify({'success': False, 'modo': 'servidor'})
+
+# Endpoints de la API. /buscar acepta el cuerpo JSON por POST o los mismos campos como query
+# string por GET; por GET la respuesta se puede revalidar con If-None-Match (304 sin recalcular).
+@app.route('/buscar', methods=['GET', 'POST'])
 def buscar_baterias():
     try:
-        data = request.get_json() or {}
+        if request.method == 'GET':
+            data = request.args.to_dict()
+        else:
+            data = request.get_json() or {}
         logger.info(f"📥 Datos recibidos: {data}")
+        registrar_busqueda(data)
 
         # Obtener datos del formulario
-        tipo = data.get('tipo', '').strip()
-        aplicacion = data.get('aplicacion', '').strip()
-        voltaje_val = _try_float(data.get('voltaje', 0))
-        corriente_val = _try_float(data.get('corriente', 0))
-        capacidad_wh_val = _try_float(data.get('capacidad_wh', 0))
-        autonomia_horas_val = _try_float(data.get('autonomia_horas', 0))
-        potencia_carga_val = _try_float(data.get('potencia_carga', 0))
-        permitir_arreglos = bool(data.get('permitir_arreglos', False))
-
-        logger.info(f"🔍 Búsqueda: {tipo}, {aplicacion}, {voltaje_val}V, {corriente_val}A, arreglos={permitir_arreglos}")
-
-        # Cargar catálogo
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        if cat.empty:
-            return jsonify({'success': False, 'error': 'No se pudo cargar el catálogo de baterías'})
-
-        # Calcular baterías
-        res = calcular_baterias(
-            cat=cat,
-            voltaje=voltaje_val,
-            corriente=corriente_val,
-            capacidad=capacidad_wh_val,
-            tipo_bateria=tipo,
-            aplicacion=aplicacion,
-            autonomia_horas=autonomia_horas_val,
-            potencia_carga=potencia_carga_val,
-            permitir_arreglos=permitir_arreglos,
-            umbral_similitud=0.6
-        )
-
-        if res.empty:
-            return jsonify({'success': True, 'resultados': [], 'total': 0})
-
-        # Construir respuesta
-        resultados = []
-        for _, bateria in res.iterrows():
-            numero_parte = (
-                bateria.get('no_de_parte') or 
-                bateria.get('no._de_parte') or 
-                bateria.get('numero_parte') or
-                'N/A'
-            )
-            
-            aplicaciones = (
-                bateria.get('uso') or 
-                bateria.get('aplicacion') or 
-                bateria.get('aplicaciones') or
-                'N/A'
-            )
-
-            resultados.append({
-                'tipo': bateria.get('tipo', 'N/A'),
-                'numero_parte': numero_parte,
-                'voltaje': bateria.get('voltaje_v', 0),
-                'corriente': bateria.get('corriente_ah', 0),
-                'capacidad_wh': bateria.get('capacidad_individual_wh', 0),
-                'aplicaciones': aplicaciones,
-                'n_serie': int(bateria.get('n_serie', 1)),
-                'n_paralelo': int(bateria.get('n_paralelo', 1)),
-                'voltaje_total': bateria.get('voltaje_total_v', 0),
-                'corriente_total': bateria.get('corriente_total_ah', 0),
-                'capacidad_total': bateria.get('capacidad_total_wh', 0),
-                'es_arreglo': bool(bateria.get('es_arreglo', False))
-            })
-
-        capacidad_calculada = autonomia_horas_val * potencia_carga_val if autonomia_horas_val and potencia_carga_val else None
-
-        return jsonify({
-            'success': True,
-            'resultados': resultados,
-            'total': len(resultados),
-            'capacidad_calculada': capacidad_calculada,
-            'permitir_arreglos': permitir_arreglos
-        })
+        consulta = ConsultaBaterias.desde_dict(data)
+        logger.info(f"🔍 Búsqueda: {consulta.tipo}, {consulta.aplicacion}, {consulta.voltaje}V, {consulta.corriente}A, arreglos={consulta.permitir_arreglos}")
+
+        _, version = motor.catalogo()
+        huella = _huella_busqueda(version, consulta) if version is not None else None
+        codificacion = _elegir_codificacion()
+        # La variante sin comprimir también vale: es la que se envía por debajo del umbral
+        etag_vigente = None
+        if huella and request.method == 'GET':
+            etag_vigente = next((e for e in (f"{huella}-{codificacion}", f"{huella}-identity")
+                                 if request.if_none_match.contains(e)), None)
+        if etag_vigente:
+            logger.info("♻️ Búsqueda sin cambios (304)")
+            respuesta = Response(status=304)
+            respuesta.set_etag(etag_vigente)
+            respuesta.headers['Cache-Control'] = 'no-cache'
+            respuesta.headers['Vary'] = 'Accept-Encoding'
+            return respuesta
+
+        # Las respuestas ya en caché no cuestan nada; el resto pasa por el control de admisión
+        en_cache = _codificada_en_cache(version, huella, codificacion) or motor.respuesta_en_cache(consulta)
+        costo = 0 if en_cache else motor.costo_estimado(consulta)
+        pesada = False
+        if costo > 0:
+            admitida, espera, pesada = admision.admitir(_cliente(), costo)
+            if not admitida:
+                logger.warning(f"🚦 Búsqueda rechazada ({costo:.0f}ms estimados, {'cupo de pesadas lleno' if pesada else 'límite del cliente'})")
+                respuesta = jsonify({'success': False, 'error': 'Demasiadas búsquedas, intente de nuevo en unos segundos'})
+                respuesta.status_code = 429
+                respuesta.headers['Retry-After'] = str(espera)
+                return respuesta
+        try:
+            return _respuesta_comprimida(consulta, version, huella, codificacion)
+        finally:
+            admision.liberar(pesada)
 
     except Exception as e:
         logger.error(f"❌ Error en búsqueda: {str(e)}", exc_info=True)
@@ -409,13 +472,7 @@ def buscar_baterias():
 @app.route('/tipos-baterias')
 def obtener_tipos_baterias():
     try:
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        if 'tipo' in cat.columns:
-            tipos = cat['tipo'].dropna().apply(_norm).unique().tolist()
-            tipos = sorted([t for t in tipos if t and t.strip()])
-        else:
-            tipos = []
-        return jsonify({'success': True, 'tipos': tipos})
+        return jsonify(motor.faceta('tipos', _payload_tipos))
     except Exception as e:
         logger.error(f"Error obteniendo tipos: {e}")
         return jsonify({'success': False, 'tipos': []})
@@ -423,34 +480,7 @@ def obtener_tipos_baterias():
 @app.route('/aplicaciones')
 def obtener_aplicaciones():
     try:
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        aplicaciones_set = set()
-        
-        columnas_aplicaciones = ['uso', 'aplicacion', 'aplicaciones']
-        columna_encontrada = None
-        
-        for col in columnas_aplicaciones:
-            if col in cat.columns:
-                columna_encontrada = col
-                break
-        
-        if columna_encontrada:
-            for uso in cat[columna_encontrada]:
-                if pd.notna(uso):
-                    uso_str = str(uso).strip()
-                    separadores = [',', ';', '/', '|', ' y ', ' e ']
-                    for sep in separadores:
-                        uso_str = uso_str.replace(sep, ',')
-                    terminos = uso_str.split(',')
-                    for termino in terminos:
-                        termino_limpio = termino.strip()
-                        if termino_limpio:
-                            termino_normalizado = _norm_avanzada(termino_limpio)
-                            if termino_normalizado and len(termino_normalizado) > 2:
-                                aplicaciones_set.add(termino_normalizado)
-        
-        aplicaciones_filtradas = sorted([a for a in aplicaciones_set if a and len(a) > 2])
-        return jsonify({'success': True, 'aplicaciones': aplicaciones_filtradas})
+        return jsonify(motor.faceta('aplicaciones', _payload_aplicaciones))
     except Exception as e:
         logger.error(f"Error obteniendo aplicaciones: {e}")
         return jsonify({'success': False, 'aplicaciones': []})
@@ -461,41 +491,7 @@ def obtener_aplicaciones_por_tipo():
         tipo_bateria = request.args.get('tipo', '').strip()
         if not tipo_bateria:
             return jsonify({'success': False, 'aplicaciones': []})
-        
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        if cat.empty or 'tipo' not in cat.columns:
-            return jsonify({'success': False, 'aplicaciones': []})
-        
-        tipo_normalizado = _norm(tipo_bateria)
-        cat['tipo_norm'] = cat['tipo'].astype(str).apply(_norm)
-        cat_filtrado = cat[cat['tipo_norm'] == tipo_normalizado]
-        
-        aplicaciones_set = set()
-        columnas_aplicaciones = ['uso', 'aplicacion', 'aplicaciones']
-        columna_encontrada = None
-        
-        for col in columnas_aplicaciones:
-            if col in cat_filtrado.columns:
-                columna_encontrada = col
-                break
-        
-        if columna_encontrada:
-            for uso in cat_filtrado[columna_encontrada]:
-                if pd.notna(uso):
-                    uso_str = str(uso).strip()
-                    separadores = [',', ';', '/', '|', ' y ', ' e ']
-                    for sep in separadores:
-                        uso_str = uso_str.replace(sep, ',')
-                    terminos = uso_str.split(',')
-                    for termino in terminos:
-                        termino_limpio = termino.strip()
-                        if termino_limpio:
-                            termino_normalizado = _norm_avanzada(termino_limpio)
-                            if termino_normalizado and len(termino_normalizado) > 2:
-                                aplicaciones_set.add(termino_normalizado)
-        
-        aplicaciones_filtradas = sorted([a for a in aplicaciones_set if a and len(a) > 2])
-        return jsonify({'success': True, 'aplicaciones': aplicaciones_filtradas})
+        return jsonify(motor.faceta('aplicaciones_por_tipo', _payload_aplicaciones_por_tipo, tipo_bateria))
     except Exception as e:
         logger.error(f"Error obteniendo aplicaciones por tipo: {e}")
         return jsonify({'success': False, 'aplicaciones': []})
@@ -506,19 +502,7 @@ def obtener_voltajes_por_tipo():
         tipo_bateria = request.args.get('tipo', '').strip()
         if not tipo_bateria:
             return jsonify({'success': False, 'voltajes': []})
-        
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        if cat.empty or 'tipo' not in cat.columns or 'voltaje_v' not in cat.columns:
-            return jsonify({'success': False, 'voltajes': []})
-        
-        tipo_normalizado = _norm(tipo_bateria)
-        cat['tipo_norm'] = cat['tipo'].astype(str).apply(_norm)
-        cat_filtrado = cat[cat['tipo_norm'] == tipo_normalizado]
-        
-        voltajes = cat_filtrado['voltaje_v'].dropna().unique()
-        voltajes = sorted([v for v in voltajes if v is not None and v > 0])
-        
-        return jsonify({'success': True, 'voltajes': voltajes})
+        return jsonify(motor.faceta('voltajes_por_tipo', _payload_voltajes_por_tipo, tipo_bateria))
     except Exception as e:
         logger.error(f"Error obteniendo voltajes por tipo: {e}")
         return jsonify({'success': False, 'voltajes': []})
@@ -526,14 +510,7 @@ def obtener_voltajes_por_tipo():
 @app.route('/todos-los-voltajes')
 def obtener_todos_los_voltajes():
     try:
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
-        if cat.empty or 'voltaje_v' not in cat.columns:
-            return jsonify({'success': False, 'voltajes': []})
-        
-        voltajes = cat['voltaje_v'].dropna().unique()
-        voltajes = sorted([v for v in voltajes if v is not None and v > 0])
-        
-        return jsonify({'success': True, 'voltajes': voltajes})
+        return jsonify(motor.faceta('todos_los_voltajes', _payload_todos_los_voltajes))
     except Exception as e:
         logger.error(f"Error obteniendo todos los voltajes: {e}")
         return jsonify({'success': False, 'voltajes': []})
@@ -541,18 +518,150 @@ def obtener_todos_los_voltajes():
 @app.route('/debug')
 def debug():
     try:
-        cat = cargar_catalogo_baterias(RUTA_EXCEL)
+        cat, version = motor.catalogo()
         info = {
             'archivo_existe': os.path.exists(RUTA_EXCEL),
             'catalogo_cargado': not cat.empty,
             'total_baterias': len(cat) if not cat.empty else 0,
             'columnas': cat.columns.tolist() if not cat.empty else [],
-            'ruta_excel': RUTA_EXCEL
+            'ruta_excel': RUTA_EXCEL,
+            'version_catalogo': list(version) if version else None,
+            'cache_etapas': motor.cache_etapas.estadisticas(),
+            'cache_resultados': motor.cache_resultados.estadisticas(),
+            'cache_facetas': motor.cache_facetas.estadisticas(),
+            'cache_codificadas': cache_codificadas.estadisticas(),
+            'admision': admision.estadisticas(),
+            'calentamiento': estado_calentamiento
         }
         return jsonify(info)
     except Exception as e:
         return jsonify({'error': str(e)})
 
+# Calentamiento al iniciar: se carga el catálogo, se construyen las facetas y se llenan las
+# cachés con las búsquedas más comunes, para que las primeras consultas después de un deploy
+# (o de que Render despierte la instancia) no paguen la lectura del Excel ni la búsqueda difusa.
+# Por defecto corre en segundo plano: el servidor abre el puerto enseguida y /listo responde
+# 503 hasta que termina. 'sincrono' lo hace durante el import (retrasa el arranque).
+# Si el calentamiento falla (p. ej. el Excel no se pudo leer al arrancar) o cambia la versión
+# del catálogo, la siguiente consulta a /listo lo vuelve a lanzar en segundo plano.
+#   CALENTAMIENTO: 'segundo_plano' (por defecto), 'sincrono' o 'no'
+#   CONSULTAS_CALENTAMIENTO: archivo JSONL con cuerpos de /buscar; si no se indica se usan
+#       VOLTAJES_CALENTAMIENTO x las N_APLICACIONES_CALENTAMIENTO más frecuentes x arreglos sí/no
+#   PRESUPUESTO_CALENTAMIENTO_MS: suma máxima de costo estimado (MotorBaterias.costo_estimado)
+#       de las búsquedas que se calientan; las que no caben en lo que queda se omiten
+MODO_CALENTAMIENTO = os.environ.get('CALENTAMIENTO', 'segundo_plano').strip().lower()
+RUTA_CONSULTAS_CALENTAMIENTO = os.environ.get('CONSULTAS_CALENTAMIENTO', '').strip()
+VOLTAJES_CALENTAMIENTO = [leer_numero(v) for v in os.environ.get('VOLTAJES_CALENTAMIENTO', '12,24,48').split(',') if v.strip()]
+N_APLICACIONES_CALENTAMIENTO = int(os.environ.get('N_APLICACIONES_CALENTAMIENTO', 5))
+PRESUPUESTO_CALENTAMIENTO_MS = float(os.environ.get('PRESUPUESTO_CALENTAMIENTO_MS', 5000))
+
+estado_calentamiento = {
+    'listo': False,
+    'en_progreso': False,
+    'consultas': 0,
+    'omitidas': 0,
+    'duracion_s': None,
+    'version_catalogo': None,
+    'error': None,
+}
+_calentamiento_lock = threading.Lock()
+
+def _aplicaciones_frecuentes(cat, n):
+    columna = buscar_columna_aplicacion(cat)
+    if not columna or n <= 0:
+        return []
+    conteo = {}
+    for uso, filas in cat[columna].value_counts().items():
+        for termino in _terminos_aplicacion(pd.Series([uso])):
+            conteo[termino] = conteo.get(termino, 0) + filas
+    return [t for t, _ in sorted(conteo.items(), key=lambda x: (-x[1], x[0]))[:n]]
+
+def consultas_calentamiento(cat):
+    if RUTA_CONSULTAS_CALENTAMIENTO:
+        consultas = []
+        with open(RUTA_CONSULTAS_CALENTAMIENTO, encoding='utf-8') as f:
+            for linea in f:
+                if linea.strip():
+                    consultas.append(json.loads(linea))
+        return consultas
+
+    aplicaciones = [''] + _aplicaciones_frecuentes(cat, N_APLICACIONES_CALENTAMIENTO)
+    return [
+        {'tipo': '', 'aplicacion': aplicacion, 'voltaje': voltaje, 'permitir_arreglos': arreglos}
+        for voltaje in VOLTAJES_CALENTAMIENTO
+        for aplicacion in aplicaciones
+        for arreglos in (False, True)
+    ]
+
+def calentar():
+    inicio = time.perf_counter()
+    # El error anterior se mantiene en /listo hasta que un calentamiento termine bien
+    estado_calentamiento.update(en_progreso=True, listo=False)
+    try:
+        cat, version = motor.catalogo()
+        if cat.empty:
+            raise RuntimeError('No se pudo cargar el catálogo de baterías')
+
+        tipos = motor.faceta('tipos', _payload_tipos)['tipos']
+        motor.faceta('aplicaciones', _payload_aplicaciones)
+        motor.faceta('todos_los_voltajes', _payload_todos_los_voltajes)
+        for tipo in tipos:
+            motor.faceta('aplicaciones_por_tipo', _payload_aplicaciones_por_tipo, tipo)
+            motor.faceta('voltajes_por_tipo', _payload_voltajes_por_tipo, tipo)
+        obtener_snapshot()
+
+        # El costo se estima con la caché de etapas ya llenada por las consultas anteriores
+        presupuesto = PRESUPUESTO_CALENTAMIENTO_MS
+        calentadas = omitidas = 0
+        for consulta in consultas_calentamiento(cat):
+            try:
+                consulta = ConsultaBaterias.desde_dict(consulta)
+                costo = motor.costo_estimado(consulta)
+                if costo > presupuesto:
+                    omitidas += 1
+                    continue
+                presupuesto -= costo
+                _respuesta_busqueda(consulta)
+                calentadas += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Consulta de calentamiento fallida {consulta}: {e}")
+
+        estado_calentamiento.update(listo=True, consultas=calentadas, omitidas=omitidas, version_catalogo=list(version), error=None)
+        logger.info(f"🔥 Calentamiento terminado: {calentadas} consultas ({omitidas} omitidas por costo) en {time.perf_counter() - inicio:.2f}s")
+    except Exception as e:
+        logger.error(f"❌ Error en el calentamiento: {e}", exc_info=True)
+        estado_calentamiento['error'] = str(e)
+    finally:
+        estado_calentamiento.update(en_progreso=False, duracion_s=round(time.perf_counter() - inicio, 3))
+
+# Lanza calentar() en un hilo si no hay otro calentamiento en curso
+def iniciar_calentamiento():
+    with _calentamiento_lock:
+        if estado_calentamiento['en_progreso']:
+            return False
+        estado_calentamiento.update(en_progreso=True, listo=False)
+    threading.Thread(target=calentar, name='calentamiento', daemon=True).start()
+    return True
+
+# Readiness: 200 cuando el calentamiento terminó para la versión actual del catálogo, 503
+# mientras tanto. Un calentamiento fallido o de otra versión se relanza aquí, así un error
+# pasajero al arrancar no deja la instancia sin health check hasta el siguiente deploy.
+@app.route('/listo')
+def listo():
+    if MODO_CALENTAMIENTO != 'no' and not estado_calentamiento['en_progreso']:
+        version = motor.version_actual()
+        version = list(version) if version else None
+        if estado_calentamiento['error'] or version != estado_calentamiento['version_catalogo']:
+            iniciar_calentamiento()
+    return jsonify(estado_calentamiento), (200 if estado_calentamiento['listo'] else 503)
+
+if MODO_CALENTAMIENTO == 'sincrono':
+    calentar()
+elif MODO_CALENTAMIENTO == 'no':
+    estado_calentamiento['listo'] = True
+else:
+    iniciar_calentamiento()
+
 if __name__ == '__main__':
     # Para producción, usa el puerto de Render
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,181 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from api3 import app as app_flask
+
+logger = logging.getLogger(__name__)
+
+# Entrada ASGI para la API. Expone exactamente las mismas rutas y respuestas que api3.py
+# (se ejecuta la app Flask vía WSGI), pero el servidor ASGI mantiene las conexiones en un
+# solo event loop y el trabajo de Flask se hace en pools de hilos acotados:
+#   - /buscar (búsqueda con filtros difusos y arreglos) va a un pool propio con límite de
+#     peticiones admitidas; si está lleno se responde 503 con Retry-After en vez de encolar
+#     sin límite.
+#   - El resto de endpoints (facetas, snapshot, /listo, página) usa otro pool, así una
+#     búsqueda lenta no retrasa los fetch paralelos de index3.html.
+# Cada petición tiene un tiempo máximo; al vencerse se responde 504.
+#
+# Uso:  uvicorn asgi:app --host 0.0.0.0 --port $PORT
+RUTAS_PESADAS = {'/buscar'}
+TRABAJADORES_BUSQUEDA = int(os.environ.get('ASGI_TRABAJADORES_BUSQUEDA', 4))
+TRABAJADORES_LIGEROS = int(os.environ.get('ASGI_TRABAJADORES_LIGEROS', 4))
+MAX_BUSQUEDAS_ADMITIDAS = int(os.environ.get('ASGI_MAX_BUSQUEDAS', 16))
+TIMEOUT_BUSQUEDA_S = float(os.environ.get('ASGI_TIMEOUT_BUSQUEDA_S', 20))
+TIMEOUT_LIGERO_S = float(os.environ.get('ASGI_TIMEOUT_LIGERO_S', 10))
+MAX_CUERPO_BYTES = int(os.environ.get('ASGI_MAX_CUERPO_BYTES', 1024 * 1024))
+
+
+def _respuesta_json(status, datos, cabeceras=()):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+    cabeceras = [('Content-Type', 'application/json'), ('Content-Length', str(len(cuerpo)))] + list(cabeceras)
+    return status, cabeceras, cuerpo
+
+
+def _environ_wsgi(scope, cuerpo):
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = valor
+        elif nombre == 'CONTENT_LENGTH':
+            continue
+        else:
+            clave = f"HTTP_{nombre}"
+            environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+def _ejecutar_wsgi(app_wsgi, environ):
+    respuesta = {}
+    partes = []
+
+    def start_response(status, cabeceras, exc_info=None):
+        respuesta['status'] = int(status.split(' ', 1)[0])
+        respuesta['cabeceras'] = cabeceras
+        return partes.append
+
+    iterable = app_wsgi(environ, start_response)
+    try:
+        for parte in iterable:
+            partes.append(parte)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return respuesta['status'], respuesta['cabeceras'], b''.join(partes)
+
+
+class PuenteASGI:
+    def __init__(self, app_wsgi):
+        self.app_wsgi = app_wsgi
+        self.pool_busqueda = ThreadPoolExecutor(TRABAJADORES_BUSQUEDA, thread_name_prefix='asgi-buscar')
+        self.pool_ligero = ThreadPoolExecutor(TRABAJADORES_LIGEROS, thread_name_prefix='asgi-ligero')
+        # Búsquedas admitidas que siguen ocupando el pool (incluidas las que ya vencieron
+        # pero cuyo hilo aún no termina); solo se modifica desde el event loop
+        self.busquedas_admitidas = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        pesada = scope['path'] in RUTAS_PESADAS
+        if pesada and self.busquedas_admitidas >= MAX_BUSQUEDAS_ADMITIDAS:
+            await self._enviar(send, *_respuesta_json(
+                503, {'success': False, 'error': 'Servidor ocupado, intente de nuevo en unos segundos'},
+                [('Retry-After', '1')]))
+            return
+
+        cuerpo = await self._leer_cuerpo(receive)
+        if cuerpo is None:
+            await self._enviar(send, *_respuesta_json(413, {'success': False, 'error': 'Petición demasiado grande'}))
+            return
+
+        loop = asyncio.get_running_loop()
+        environ = _environ_wsgi(scope, cuerpo)
+        if pesada:
+            self.busquedas_admitidas += 1
+            futuro = loop.run_in_executor(self.pool_busqueda, _ejecutar_wsgi, self.app_wsgi, environ)
+            futuro.add_done_callback(self._liberar_busqueda)
+            timeout = TIMEOUT_BUSQUEDA_S
+        else:
+            futuro = loop.run_in_executor(self.pool_ligero, _ejecutar_wsgi, self.app_wsgi, environ)
+            timeout = TIMEOUT_LIGERO_S
+
+        try:
+            respuesta = await asyncio.wait_for(asyncio.shield(futuro), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ {scope['method']} {scope['path']} superó {timeout}s")
+            respuesta = _respuesta_json(504, {'success': False, 'error': 'Tiempo de espera agotado'})
+        except Exception as e:
+            logger.error(f"❌ Error atendiendo {scope['path']}: {e}", exc_info=True)
+            respuesta = _respuesta_json(500, {'success': False, 'error': f'Error interno del servidor: {str(e)}'})
+        await self._enviar(send, *respuesta)
+
+    def _liberar_busqueda(self, _futuro):
+        self.busquedas_admitidas -= 1
+
+    async def _leer_cuerpo(self, receive):
+        partes = []
+        total = 0
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                break
+            parte = mensaje.get('body', b'')
+            total += len(parte)
+            if total > MAX_CUERPO_BYTES:
+                return None
+            partes.append(parte)
+            if not mensaje.get('more_body', False):
+                break
+        return b''.join(partes)
+
+    async def _enviar(self, send, status, cabeceras, cuerpo):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in cabeceras],
+        })
+        await send({'type': 'http.response.body', 'body': cuerpo})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                self.pool_busqueda.shutdown(wait=False)
+                self.pool_ligero.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = PuenteASGI(app_flask)
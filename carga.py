@@ -0,0 +1,213 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+
+# Generador de carga que reproduce tráfico real de /buscar.
+# El registro es un JSONL con un cuerpo de /buscar por línea: el que escribe api3.py cuando
+# se define REGISTRO_BUSQUEDAS (mismo formato que CONSULTAS_CALENTAMIENTO).
+# Destino: --url contra una instancia ya levantada (gunicorn api3:app, uvicorn asgi:app,
+# python api3.py) o, sin --url, el test client de Flask dentro del mismo proceso.
+#
+# Ejemplo:
+#   REGISTRO_BUSQUEDAS=busquedas.jsonl gunicorn api3:app      # grabar tráfico
+#   python carga.py busquedas.jsonl --url http://127.0.0.1:8000 --concurrencia 16 --facetas 0.3
+FACETAS_FIJAS = ['/tipos-baterias', '/aplicaciones', '/todos-los-voltajes']
+FACETAS_POR_TIPO = ['/aplicaciones-por-tipo?tipo={}', '/voltajes-por-tipo?tipo={}']
+PERCENTILES = (50, 90, 99)
+
+
+def leer_registro(ruta):
+    consultas = []
+    with open(ruta, encoding='utf-8') as f:
+        for linea in f:
+            if linea.strip():
+                consultas.append(json.loads(linea))
+    return consultas
+
+
+def plan_peticiones(consultas, n, fraccion_facetas=0.0, semilla=0):
+    # Lista de (metodo, ruta, cuerpo); las búsquedas se toman en el orden del registro
+    # (cíclico) y una fracción de las peticiones se reemplaza por facetas, como hace la
+    # página al cargar o al cambiar de tipo
+    rng = random.Random(semilla)
+    tipos = sorted({str(c.get('tipo', '')).strip() for c in consultas} - {''})
+    plan = []
+    for i in range(n):
+        if rng.random() < fraccion_facetas:
+            rutas = FACETAS_FIJAS + (FACETAS_POR_TIPO if tipos else [])
+            ruta = rng.choice(rutas)
+            if '{}' in ruta:
+                ruta = ruta.format(quote(rng.choice(tipos)))
+            plan.append(('GET', ruta, None))
+        else:
+            plan.append(('POST', '/buscar', consultas[i % len(consultas)]))
+    return plan
+
+
+class ClienteHTTP:
+    def __init__(self, url_base, timeout=30):
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+
+    def enviar(self, metodo, ruta, cuerpo, cabeceras=None):
+        datos = json.dumps(cuerpo).encode('utf-8') if cuerpo is not None else None
+        peticion = urllib.request.Request(self.url_base + ruta, data=datos, method=metodo,
+                                          headers={'Content-Type': 'application/json', **(cabeceras or {})})
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+                return respuesta.status, respuesta.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class ClienteFlask:
+    def __init__(self):
+        # Importar api3 carga el catálogo y hace el calentamiento según CALENTAMIENTO
+        from api3 import app
+        self.app = app
+        self.local = threading.local()
+
+    def enviar(self, metodo, ruta, cuerpo, cabeceras=None):
+        if not hasattr(self.local, 'cliente'):
+            self.local.cliente = self.app.test_client()
+        respuesta = self.local.cliente.open(ruta, method=metodo, json=cuerpo, headers=cabeceras)
+        return respuesta.status_code, respuesta.data
+
+
+def _es_error(status, datos, ruta):
+    if status >= 400:
+        return True
+    # /buscar responde 200 con success=False cuando falla el cálculo
+    if ruta == '/buscar':
+        try:
+            return not json.loads(datos).get('success', False)
+        except ValueError:
+            return True
+    return False
+
+
+def _ip_simulada(n):
+    return f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"
+
+
+def ejecutar_carga(cliente, plan, concurrencia=8, tasa=0, clientes=0):
+    # Con tasa > 0 cada petición tiene una hora de salida programada (i / tasa) y su
+    # latencia se mide desde esa hora, así la espera por falta de trabajadores cuenta
+    # como latencia en vez de esconderse (omisión coordinada).
+    # Con clientes > 0 las peticiones se reparten entre esa cantidad de clientes simulados
+    # (X-Forwarded-For distinto), para que el límite por cliente de la API vea tráfico real;
+    # la API solo usa ese encabezado si se levanta con PROXIES_CONFIABLES=1
+    muestras = []
+    lock = threading.Lock()
+    inicio = time.perf_counter()
+
+    def trabajo(i):
+        metodo, ruta, cuerpo = plan[i]
+        t0 = time.perf_counter()
+        if tasa > 0:
+            t0 = inicio + i / tasa
+            espera = t0 - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+        cabeceras = {'X-Forwarded-For': _ip_simulada(i % clientes)} if clientes > 0 else None
+        try:
+            status, datos = cliente.enviar(metodo, ruta, cuerpo, cabeceras)
+            error = _es_error(status, datos, ruta.split('?', 1)[0])
+        except Exception:
+            status, error = None, True
+        latencia = time.perf_counter() - t0
+        with lock:
+            muestras.append((ruta.split('?', 1)[0], latencia, status, error))
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        list(ejecutor.map(trabajo, range(len(plan))))
+    return muestras, time.perf_counter() - inicio
+
+
+def _estadisticas(latencias, errores, duracion):
+    ms = np.asarray(latencias, dtype=np.float64) * 1000
+    resumen = {
+        'peticiones': len(ms),
+        'errores': int(errores),
+        'tasa_error': round(errores / len(ms), 4) if len(ms) else 0.0,
+        'rps': round(len(ms) / duracion, 2) if duracion > 0 else 0.0,
+    }
+    if len(ms):
+        resumen['latencia_ms'] = {f'p{p}': round(float(np.percentile(ms, p)), 2) for p in PERCENTILES}
+        resumen['latencia_ms'].update(media=round(float(ms.mean()), 2), max=round(float(ms.max()), 2))
+    return resumen
+
+
+def resumir(muestras, duracion):
+    por_ruta = defaultdict(list)
+    for ruta, latencia, status, error in muestras:
+        por_ruta[ruta].append((latencia, status, error))
+
+    resumen = _estadisticas([m[1] for m in muestras], sum(m[3] for m in muestras), duracion)
+    resumen['duracion_s'] = round(duracion, 3)
+    resumen['rutas'] = {}
+    for ruta, filas in sorted(por_ruta.items()):
+        stats = _estadisticas([f[0] for f in filas], sum(f[2] for f in filas), duracion)
+        conteo_status = defaultdict(int)
+        for _, status, _ in filas:
+            conteo_status[str(status)] += 1
+        stats['status'] = dict(sorted(conteo_status.items()))
+        resumen['rutas'][ruta] = stats
+    return resumen
+
+
+def imprimir_resumen(resumen):
+    lat = resumen.get('latencia_ms', {})
+    print(f"=== {resumen['peticiones']} peticiones en {resumen['duracion_s']}s: {resumen['rps']} req/s, "
+          f"{resumen['errores']} errores ({resumen['tasa_error']*100:.1f}%) ===")
+    if lat:
+        print("Latencia total (ms): " + ", ".join(f"{k}={v}" for k, v in lat.items()))
+    print(f"\n{'ruta':<24}{'n':>7}{'req/s':>9}{'err':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  status")
+    for ruta, stats in resumen['rutas'].items():
+        lat = stats.get('latencia_ms', {})
+        print(f"{ruta:<24}{stats['peticiones']:>7}{stats['rps']:>9}{stats['errores']:>6}"
+              f"{lat.get('p50', 0):>9}{lat.get('p90', 0):>9}{lat.get('p99', 0):>9}{lat.get('max', 0):>9}  {stats['status']}")
+
+
+def main_carga():
+    parser = argparse.ArgumentParser(description="Reproduce búsquedas registradas contra la API de baterías")
+    parser.add_argument("registro", help="JSONL con un cuerpo de /buscar por línea")
+    parser.add_argument("--url", default=None, help="URL base de una instancia en marcha; sin ella se usa el test client de Flask")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--tasa", type=float, default=0, help="Peticiones por segundo objetivo (0 = tan rápido como se pueda)")
+    parser.add_argument("--peticiones", type=int, default=0, help="Total a enviar (0 = una pasada por el registro)")
+    parser.add_argument("--facetas", type=float, default=0.0, help="Fracción de peticiones a endpoints de facetas")
+    parser.add_argument("--clientes", type=int, default=0, help="Clientes simulados vía X-Forwarded-For (0 = todas desde esta máquina); requiere PROXIES_CONFIABLES=1 en la API")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", default=None, help="Guardar el resumen en este archivo JSON")
+    args = parser.parse_args()
+
+    consultas = leer_registro(args.registro)
+    if not consultas:
+        print(f"[ERROR] El registro {args.registro} no tiene consultas.")
+        return
+
+    cliente = ClienteHTTP(args.url, timeout=args.timeout) if args.url else ClienteFlask()
+    plan = plan_peticiones(consultas, args.peticiones or len(consultas), args.facetas, args.semilla)
+    muestras, duracion = ejecutar_carga(cliente, plan, concurrencia=args.concurrencia, tasa=args.tasa, clientes=args.clientes)
+    resumen = resumir(muestras, duracion)
+    resumen['configuracion'] = {k: v for k, v in vars(args).items() if k != 'json'}
+
+    imprimir_resumen(resumen)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2)
+        print(f"\nResumen guardado en: {args.json}")
+
+if __name__ == "__main__":
+    main_carga()
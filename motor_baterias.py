@@ -0,0 +1,991 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from math import ceil, isfinite
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Motor de búsqueda de baterías compartido por la API (api3.py) y la calculadora de consola
+# (calc11.py): carga y compactación del catálogo, unión con los usos de db.json, normalización
+# de textos, búsqueda difusa de aplicaciones, pipeline de filtros/arreglos con caché por etapas
+# y el objeto MotorBaterias que guarda el catálogo en memoria junto con su versión.
+
+try:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    BASE_DIR = os.getcwd()
+RUTA_EXCEL = os.path.join(BASE_DIR, "DuracionBateriasAG.xlsx")
+RUTA_DB = os.path.join(BASE_DIR, "db.json")
+
+COLUMNAS_APLICACION = ['uso', 'aplicacion', 'aplicaciones']
+COLUMNAS_NUMERO_PARTE = ['no_de_parte', 'no._de_parte', 'numero_parte']
+# Usos que no vienen del Excel y que también se consultan al filtrar por aplicación
+COLUMNAS_USO_ADICIONALES = ['usos_db']
+
+def _try_float(x):
+    try:
+        return float(str(x).replace(",", ".").strip())
+    except:
+        return 0
+
+# Booleanos que llegan como JSON o como texto de query string ("true", "1", "s", "on"...)
+def _leer_bool(x):
+    if isinstance(x, str):
+        return x.strip().lower() in ('1', 'true', 's', 'si', 'sí', 'on', 'yes')
+    return bool(x)
+
+# Normalización mejorada de las palabras del usuario
+def _norm(s: str) -> str:
+    s = (s or "").strip().lower()
+    rep = {"á":"a","é":"e","í":"i","ó":"o","ú":"u","ü":"u","ñ":"n"}
+    for k,v in rep.items():
+        s = s.replace(k,v)
+    return s
+
+# Normalización avanzada para búsqueda inteligente
+def _norm_avanzada(s: str) -> str:
+    s = (s or "").strip().lower()
+    rep = {"á":"a","é":"e","í":"i","ó":"o","ú":"u","ü":"u","ñ":"n"}
+    for k,v in rep.items():
+        s = s.replace(k,v)
+
+    # Eliminar palabras de conexión comunes
+    palabras_conexion = {
+        'de', 'del', 'la', 'el', 'y', 'en', 'a', 'para', 'por', 'con', 'sin',
+        'sobre', 'bajo', 'entre', 'hacia', 'desde', 'hasta', 'mediante', 'según',
+        'como', 'que', 'cuando', 'donde', 'cual', 'quien', 'cuyo', 'cuyas', 'cuyos',
+        'unas', 'unos', 'una', 'un', 'lo', 'los', 'las', 'al', 'se', 'su', 'sus',
+        'este', 'esta', 'estos', 'estas', 'ese', 'esa', 'esos', 'esas', 'aquel',
+        'aquella', 'aquellos', 'aquellas', 'otro', 'otra', 'otros', 'otras',
+        'mismo', 'misma', 'mismos', 'mismas', 'todo', 'toda', 'todos', 'todas',
+        'cada', 'cualquier', 'cualesquiera', 'varios', 'varias', 'ambos', 'ambas',
+        'etc', 'etcétera', 'entre otros', 'entre otras', 'para que', 'de la', 'de los',
+        'de las', 'en la', 'en el', 'a la', 'al', 'del', 'y las', 'y los', 'y la', 'y el'
+    }
+
+    # Eliminar caracteres especiales y dividir en palabras
+    s = re.sub(r'[^\w\s]', ' ', s)
+    palabras = re.findall(r'\b[a-z0-9]+\b', s)
+
+    # Filtrar palabras de conexión y palabras muy cortas sin significado
+    palabras_filtradas = [p for p in palabras if p not in palabras_conexion and len(p) > 2]
+
+    return ' '.join(palabras_filtradas)
+
+# Función para calcular similitud entre cadenas
+def _calcular_similitud(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+# Función para buscar coincidencias con umbral de similitud
+def _buscar_coincidencias(texto: str, busqueda: str, umbral=0.7) -> bool:
+    if not texto or not busqueda:
+        return False
+
+    return _buscar_coincidencias_norm(_norm_avanzada(texto), _norm_avanzada(busqueda), umbral)
+
+# Misma comparación, pero con textos ya pasados por _norm_avanzada (p. ej. categorías del catálogo compacto)
+def _buscar_coincidencias_norm(texto_norm: str, busqueda_norm: str, umbral=0.7) -> bool:
+    if not texto_norm or not busqueda_norm:
+        return False
+
+    # Dividir ambos textos en términos individuales
+    def dividir_terminos(texto):
+        separadores = [',', ';', '/', '|', ' y ', ' e ']
+        texto_para_dividir = texto
+        for sep in separadores:
+            texto_para_dividir = texto_para_dividir.replace(sep, ',')
+        return [t.strip() for t in texto_para_dividir.split(',') if t.strip()]
+
+    terminos_texto = dividir_terminos(texto_norm)
+    terminos_busqueda = dividir_terminos(busqueda_norm)
+
+    # Buscar si algún término de búsqueda coincide con algún término del texto
+    for termino_b in terminos_busqueda:
+        for termino_t in terminos_texto:
+            # Si el término de búsqueda está contenido en el término del texto
+            if termino_b in termino_t:
+                return True
+            # Calcular similitud entre términos individuales
+            similitud = _calcular_similitud(termino_b, termino_t)
+            if similitud >= umbral:
+                return True
+
+    # También verificar coincidencia completa por si acaso
+    if busqueda_norm in texto_norm:
+        return True
+
+    similitud_completa = _calcular_similitud(texto_norm, busqueda_norm)
+    return similitud_completa >= umbral
+
+# Se carga el catálogo de baterías desde la ruta del excel, se lee de la hoja Baterias
+def cargar_catalogo_baterias(ruta_excel, hoja="Baterias"):
+    try:
+        df = pd.read_excel(ruta_excel, sheet_name=hoja, dtype=str)
+    except Exception as e:
+        logger.error(f"[ERROR] No se pudo leer el archivo '{ruta_excel}': {e}")
+        return pd.DataFrame()
+
+    # Normalizar los nombres de las columnas
+    df.columns = (
+        df.columns.str.strip()
+        .str.lower()
+        .str.replace(r"[\s\-/]+","_",regex=True)
+        .str.replace(r"[()]","",regex=True)
+    )
+
+    # Se convierten los valores de las columnas a numéricos
+    for col in ['voltaje_v','corriente_ah','capacidad_bateria_wh']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(r"[^0-9.\-]","",regex=True), errors='coerce')
+
+    # Eliminar filas donde todos los valores numéricos importantes son NaN
+    columnas_numericas = [c for c in ['voltaje_v','corriente_ah','capacidad_bateria_wh'] if c in df.columns]
+    if columnas_numericas:
+        df = df.dropna(subset=columnas_numericas, how='all')
+
+    return compactar_catalogo(df)
+
+def version_archivo(ruta):
+    try:
+        st = os.stat(ruta)
+    except (OSError, TypeError):
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Clave de unión entre el catálogo y db.json: número de parte sin mayúsculas, acentos ni
+# espacios ("PM 4-4" y "pm4-4" son la misma batería; "NP 1.2-12" y "NP12-12" no)
+def _norm_parte(parte) -> str:
+    return re.sub(r"\s+", "", _norm(str(parte)))
+
+# Usos por número de parte de db.json ({"baterias": {parte: {"usos": "..."}}}), indexados por _norm_parte
+def cargar_usos_db(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ No se pudo leer '{ruta}': {e}")
+        return {}
+
+    usos = {}
+    baterias = datos.get('baterias') if isinstance(datos, dict) else None
+    for parte, info in (baterias or {}).items():
+        texto = info.get('usos') if isinstance(info, dict) else None
+        if texto and str(texto).strip():
+            usos[_norm_parte(parte)] = str(texto).strip()
+    return usos
+
+# Agrega al catálogo la columna usos_db (y su usos_db_norm) con los usos de db.json de cada
+# batería. La búsqueda en el diccionario se hace una vez por número de parte distinto y se
+# expande a las filas con los códigos de la categoría.
+def unir_usos_db(cat: pd.DataFrame, usos_db) -> pd.DataFrame:
+    columna_parte = next((c for c in COLUMNAS_NUMERO_PARTE if c in cat.columns), None)
+    if cat.empty or not usos_db or columna_parte is None:
+        return cat
+
+    partes = cat[columna_parte]
+    if not pd.api.types.is_categorical_dtype(partes):
+        partes = partes.astype('category')
+    usos = pd.Index([usos_db.get(_norm_parte(p)) for p in partes.cat.categories], dtype=object)
+    cat = cat.copy(deep=False)
+    cat['usos_db'] = pd.Categorical(usos.take(partes.cat.codes.to_numpy(), allow_fill=True, fill_value=None))
+    return compactar_catalogo(cat)
+
+# Columnas de texto que se buscan normalizadas y la función que las normaliza
+COLUMNAS_NORMALIZADAS = {
+    'tipo': _norm,
+    'uso': _norm_avanzada,
+    'aplicacion': _norm_avanzada,
+    'aplicaciones': _norm_avanzada,
+    'usos_db': _norm_avanzada,
+}
+
+# Representación compacta del catálogo: el Excel tiene pocos textos distintos repetidos
+# en muchas celdas, así que los textos se guardan como categorías (códigos + tabla de
+# valores únicos) y los números como float32. Las columnas normalizadas (tipo_norm,
+# uso_norm...) se calculan una sola vez por categoría y no por fila.
+def compactar_catalogo(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+
+    df = df.copy()
+    for col in list(df.columns):
+        serie = df[col]
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            df[col] = serie.astype(np.float32)
+        elif not pd.api.types.is_categorical_dtype(serie):
+            # Los números de parte son casi todos distintos; internarlos evita duplicar
+            # cadenas entre el catálogo y los resultados
+            valores = serie.map(lambda x: sys.intern(str(x).strip()) if pd.notna(x) else x)
+            df[col] = valores.astype('category')
+
+    for col, normalizar in COLUMNAS_NORMALIZADAS.items():
+        if col in df.columns and f"{col}_norm" not in df.columns:
+            categorias = df[col].cat.categories
+            normalizadas = pd.Index([normalizar(str(c)) for c in categorias])
+            valores = normalizadas.take(df[col].cat.codes.to_numpy(), allow_fill=True, fill_value=np.nan)
+            df[f"{col}_norm"] = pd.Categorical(valores)
+
+    return df.reset_index(drop=True)
+
+# Devuelve a float64 las columnas float32 del catálogo compacto. Se pasa por la
+# representación decimal más corta para que 12.8 siga siendo 12.8 y no 12.800000190734863.
+def _a_float64(valores):
+    if isinstance(valores, pd.Series):
+        return pd.Series(_a_float64(valores.to_numpy()), index=valores.index, name=valores.name)
+    valores = np.asarray(valores)
+    if valores.dtype == np.float32:
+        return valores.astype(str).astype(np.float64)
+    return valores
+
+def _expandir_numericos(df: pd.DataFrame) -> pd.DataFrame:
+    columnas = [c for c in df.columns if df[c].dtype == np.float32]
+    if not columnas:
+        return df
+    df = df.copy()
+    for col in columnas:
+        df[col] = _a_float64(df[col])
+    return df
+
+# Máscara booleana de filas cuya aplicación coincide con la búsqueda, en la columna de uso
+# del Excel o en alguna de las columnas de usos adicionales (db.json)
+def _mascara_aplicacion(datos: pd.DataFrame, columna: str, aplicacion: str, umbral) -> np.ndarray:
+    mascara = _mascara_columna_uso(datos, columna, aplicacion, umbral)
+    for extra in COLUMNAS_USO_ADICIONALES:
+        if extra in datos.columns and extra != columna:
+            mascara = mascara | _mascara_columna_uso(datos, extra, aplicacion, umbral)
+    return mascara
+
+# En el catálogo compacto la comparación difusa se hace una vez por categoría distinta y
+# se expande a las filas a través de los códigos.
+def _mascara_columna_uso(datos: pd.DataFrame, columna: str, aplicacion: str, umbral) -> np.ndarray:
+    columna_norm = f"{columna}_norm"
+    if columna_norm in datos.columns and pd.api.types.is_categorical_dtype(datos[columna_norm]):
+        busqueda_norm = _norm_avanzada(aplicacion)
+        coincide = np.array(
+            [_buscar_coincidencias_norm(c, busqueda_norm, umbral) for c in datos[columna_norm].cat.categories]
+            + [False],  # el código -1 (valor vacío) cae en este último elemento
+            dtype=bool,
+        )
+        return coincide[datos[columna_norm].cat.codes.to_numpy()]
+
+    def aplicar_filtro_aplicacion(fila):
+        uso_valor = fila[columna] if pd.notna(fila[columna]) else ''
+        return _buscar_coincidencias(str(uso_valor), aplicacion, umbral=umbral)
+
+    return datos.apply(aplicar_filtro_aplicacion, axis=1).to_numpy(dtype=bool)
+
+# Caché LRU ligada a una versión del catálogo: se vacía cuando la versión cambia y expulsa
+# las entradas menos usadas al superar max_bytes. Se usa para las etapas del pipeline de
+# búsqueda (MotorBaterias.cache_etapas) y para las respuestas ya construidas de la API.
+#
+# Etapas del pipeline: las consultas del UI suelen cambiar un solo
+# parámetro (p. ej. el voltaje) manteniendo tipo y aplicación, así que se guardan los
+# resultados de cada prefijo del pipeline:
+#   (tipo) -> ids de filas
+#   (tipo, aplicación, umbral) -> ids de filas
+#   (tipo, aplicación, umbral, arreglos) -> DataFrame con los arreglos calculados
+#
+# obtener/guardar reciben la versión del catálogo con que se calculó la entrada: una petición
+# que empezó con el catálogo anterior no lee ni guarda entradas después de que otro hilo
+# sincronizó la versión nueva (sus ids de filas o respuestas ya no corresponden).
+class CacheVersionada:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tamano(valor):
+        if isinstance(valor, pd.DataFrame):
+            return int(valor.memory_usage(index=True, deep=True).sum())
+        if isinstance(valor, (dict, list)):
+            return len(json.dumps(valor, default=str))
+        if isinstance(valor, (bytes, str)):
+            return len(valor)
+        if isinstance(valor, tuple):
+            return sum(CacheVersionada._tamano(v) for v in valor)
+        return int(getattr(valor, 'nbytes', 0))
+
+    def sincronizar(self, version):
+        with self._lock:
+            if version != self.version:
+                self._entradas.clear()
+                self._bytes = 0
+                self.version = version
+
+    def obtener(self, clave, version):
+        with self._lock:
+            entrada = self._entradas.get(clave) if version == self.version else None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, version):
+        tamano = self._tamano(valor)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes and self._entradas:
+                _, (_, tamano_expulsado) = self._entradas.popitem(last=False)
+                self._bytes -= tamano_expulsado
+
+    # Consulta sin efectos en el orden LRU ni en las estadísticas
+    def contiene(self, clave, version):
+        with self._lock:
+            return version == self.version and clave in self._entradas
+
+    def limpiar(self):
+        self.sincronizar(object())
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+# Ejecuta una etapa usando la caché si hay una. Las etapas de filtrado guardan solo los ids
+# de las filas que quedan; la de arreglos guarda el DataFrame resultante.
+def _etapa_con_cache(cache, version, clave, cat, calcular, guardar_ids=True):
+    if cache is None:
+        return calcular()
+    valor = cache.obtener(clave, version)
+    if valor is not None:
+        logger.info(f"♻️ Etapa '{clave[-1][0]}' desde caché: {len(valor)} filas")
+        return cat.loc[valor] if guardar_ids else valor
+    datos = calcular()
+    cache.guardar(clave, datos.index.to_numpy() if guardar_ids else datos, version)
+    return datos
+
+def _columna_aplicacion(datos):
+    for col in COLUMNAS_APLICACION:
+        if col in datos.columns:
+            return col
+    return None
+
+# Filtro por tipo con normalización (en el catálogo compacto tipo_norm ya es categórica)
+def _etapa_tipo(datos, tipo_bateria):
+    tipo_busqueda = _norm(tipo_bateria)
+    if 'tipo_norm' not in datos.columns:
+        datos = datos.copy()
+        datos['tipo_norm'] = datos['tipo'].astype(str).apply(_norm)
+    datos = datos[datos['tipo_norm'] == tipo_busqueda]
+    logger.info(f"🔧 Filtrado por tipo '{tipo_bateria}': {len(datos)} baterías")
+    return datos
+
+# Filtro por aplicación con búsqueda difusa
+def _etapa_aplicacion(datos, columna, aplicacion, umbral_similitud):
+    mask = _mascara_aplicacion(datos, columna, aplicacion, umbral_similitud)
+    datos = datos[mask]
+    logger.info(f"🔧 Filtrado por aplicación '{aplicacion}': {len(datos)} baterías")
+    return datos
+
+# LÓGICA DE ARREGLOS: una fila por batería con su configuración serie/paralelo
+# n_serie y n_paralelo de cada fila, vectorizado (también lo usa motor_particionado). Con
+# arreglos solo son válidas las filas con voltaje y corriente positivos; las demás quedan 1 x 1.
+def _configuracion_arreglos(v, a, voltaje, corriente, permitir_arreglos):
+    if not permitir_arreglos:
+        return np.ones(len(v), dtype=bool), np.ones_like(v), np.ones_like(a)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        validas = (np.nan_to_num(v) > 0) & (np.nan_to_num(a) > 0)
+        n_serie = np.maximum(1, np.ceil(voltaje / v)) if voltaje > 0 else np.ones_like(v)
+        n_paralelo = np.maximum(1, np.ceil(corriente / a)) if corriente > 0 else np.ones_like(a)
+    return validas, np.where(validas, n_serie, 1), np.where(validas, n_paralelo, 1)
+
+def _etapa_arreglos(datos, voltaje, corriente, permitir_arreglos):
+    # Cálculos en float64 sobre las filas que quedaron
+    datos = _expandir_numericos(datos)
+
+    # Crear columna de capacidad si no existe
+    if 'capacidad_bateria_wh' not in datos.columns and 'voltaje_v' in datos.columns and 'corriente_ah' in datos.columns:
+        datos = datos.copy()
+        datos['capacidad_bateria_wh'] = datos['voltaje_v'] * datos['corriente_ah']
+
+    logger.info(f"🔧 Modo arreglos {'ACTIVADO' if permitir_arreglos else 'DESACTIVADO'}")
+    v = datos['voltaje_v'].to_numpy(dtype=np.float64) if 'voltaje_v' in datos.columns else np.zeros(len(datos))
+    a = datos['corriente_ah'].to_numpy(dtype=np.float64) if 'corriente_ah' in datos.columns else np.zeros(len(datos))
+    validas, n_serie, n_paralelo = _configuracion_arreglos(v, a, voltaje, corriente, permitir_arreglos)
+
+    datos = datos[validas].copy()
+    v, a, n_serie, n_paralelo = v[validas], a[validas], n_serie[validas], n_paralelo[validas]
+    datos['n_serie'] = n_serie.astype(np.int64)
+    datos['n_paralelo'] = n_paralelo.astype(np.int64)
+    datos['voltaje_total_v'] = v * n_serie
+    datos['corriente_total_ah'] = a * n_paralelo
+    datos['capacidad_total_wh'] = datos['voltaje_total_v'] * datos['corriente_total_ah']
+    datos['es_arreglo'] = (n_serie > 1) | (n_paralelo > 1)
+
+    if permitir_arreglos:
+        logger.info(f"🔧 Generados {len(datos)} arreglos")
+    return datos
+
+# Prefijo del pipeline (tipo y aplicación) compartido por calcular_baterias y el optimizador de
+# bancos. Devuelve la clave de la etapa de aplicación, para encadenar claves de etapas siguientes,
+# y una función que entrega las filas filtradas; es perezosa para que un acierto de caché en una
+# etapa posterior no calcule estas.
+def _pipeline_filtros(cat, tipo_bateria, aplicacion, umbral_similitud, cache, version):
+    # Claves de cada prefijo del pipeline; None significa que la etapa no aplica
+    filtra_tipo = bool(tipo_bateria) and 'tipo' in cat.columns
+    columna_aplicacion = _columna_aplicacion(cat) if aplicacion and aplicacion.strip() else None
+    clave_tipo = (('tipo', _norm(tipo_bateria) if filtra_tipo else None),)
+    clave_aplicacion = clave_tipo + (
+        ('aplicacion', _norm_avanzada(aplicacion) if columna_aplicacion else None, umbral_similitud),)
+
+    def filas_tipo():
+        if not filtra_tipo:
+            return cat
+        return _etapa_con_cache(cache, version, clave_tipo, cat, lambda: _etapa_tipo(cat, tipo_bateria))
+
+    def filas_aplicacion():
+        if not columna_aplicacion:
+            return filas_tipo()
+        return _etapa_con_cache(cache, version, clave_aplicacion, cat, lambda: _etapa_aplicacion(
+            filas_tipo(), columna_aplicacion, aplicacion, umbral_similitud))
+
+    return clave_aplicacion, filas_aplicacion
+
+def _clave_arreglos(clave_aplicacion, permitir_arreglos, voltaje, corriente):
+    return clave_aplicacion + (
+        ('arreglos', True, voltaje, corriente) if permitir_arreglos else ('arreglos', False),)
+
+# Capacidad requerida (Wh) y margen que van a tener los filtros numéricos
+def _capacidad_y_margen(voltaje, corriente, capacidad, autonomia_horas, potencia_carga):
+    capacidad_requerida = capacidad
+    if autonomia_horas > 0 and potencia_carga > 0:
+        capacidad_requerida = autonomia_horas * potencia_carga
+    elif capacidad == 0 and voltaje > 0 and corriente > 0:
+        capacidad_requerida = voltaje * corriente
+
+    parametros_numericos = sum(1 for x in [voltaje, corriente, capacidad_requerida] if x > 0)
+    margen = 0.5 if parametros_numericos <= 1 else 0.3
+    return capacidad_requerida, margen
+
+# Columnas principales primero, el resto en su orden original (salida de calcular_baterias y
+# de motor_particionado)
+COLUMNAS_RESULTADO = ['tipo','no_de_parte','voltaje_v','corriente_ah','capacidad_individual_wh',
+                      'n_serie','n_paralelo','voltaje_total_v','corriente_total_ah','capacidad_total_wh','es_arreglo']
+
+def _ordenar_columnas(res):
+    cols_existentes = [c for c in COLUMNAS_RESULTADO if c in res.columns]
+    return res[cols_existentes + [c for c in res.columns if c not in cols_existentes]]
+
+# Función principal de cálculo.
+# Con cache (una CacheVersionada) y version_catalogo, las etapas de tipo, aplicación y
+# arreglos se reutilizan entre consultas que comparten esos parámetros.
+def calcular_baterias(cat: pd.DataFrame, voltaje=0, corriente=0, capacidad=0,
+                      tipo_bateria="", aplicacion="", autonomia_horas=0, potencia_carga=0,
+                      permitir_arreglos=False, umbral_similitud=0.6, cache=None, version_catalogo=None):
+
+    logger.info(f"🔧 Iniciando cálculo: voltaje={voltaje}V, corriente={corriente}A, capacidad={capacidad}Wh, arreglos={permitir_arreglos}")
+
+    if cat.empty:
+        logger.warning("❌ Catálogo vacío")
+        return pd.DataFrame()
+
+    if cache is not None:
+        cache.sincronizar(version_catalogo)
+
+    clave_aplicacion, filas_aplicacion = _pipeline_filtros(cat, tipo_bateria, aplicacion, umbral_similitud, cache, version_catalogo)
+    clave_arreglos = _clave_arreglos(clave_aplicacion, permitir_arreglos, voltaje, corriente)
+
+    datos = _etapa_con_cache(cache, version_catalogo, clave_arreglos, cat, lambda: _etapa_arreglos(
+        filas_aplicacion(), voltaje, corriente, permitir_arreglos), guardar_ids=False)
+
+    capacidad_requerida, margen = _capacidad_y_margen(voltaje, corriente, capacidad, autonomia_horas, potencia_carga)
+    logger.info(f"🔧 Capacidad requerida: {capacidad_requerida}Wh")
+
+    if datos.empty:
+        logger.warning("❌ No hay resultados después de procesar arreglos")
+        return pd.DataFrame()
+
+    # Filtrar por rangos usando los valores totales del arreglo
+    datos_filtrados = datos.copy()
+
+    if voltaje > 0 and 'voltaje_total_v' in datos_filtrados.columns:
+        rango_min_voltaje = voltaje * (1 - margen)
+        rango_max_voltaje = voltaje * (1 + margen)
+        datos_filtrados = datos_filtrados[
+            datos_filtrados['voltaje_total_v'].between(rango_min_voltaje, rango_max_voltaje)
+        ]
+        logger.info(f"🔧 Filtro voltaje: {rango_min_voltaje:.1f}V - {rango_max_voltaje:.1f}V, quedan {len(datos_filtrados)}")
+
+    if corriente > 0 and 'corriente_total_ah' in datos_filtrados.columns:
+        rango_min_corriente = corriente * (1 - margen)
+        rango_max_corriente = corriente * (1 + margen)
+        datos_filtrados = datos_filtrados[
+            datos_filtrados['corriente_total_ah'].between(rango_min_corriente, rango_max_corriente)
+        ]
+        logger.info(f"🔧 Filtro corriente: {rango_min_corriente:.1f}A - {rango_max_corriente:.1f}A, quedan {len(datos_filtrados)}")
+
+    if capacidad_requerida > 0 and 'capacidad_total_wh' in datos_filtrados.columns:
+        rango_min_capacidad = capacidad_requerida * (1 - margen)
+        rango_max_capacidad = capacidad_requerida * (1 + margen)
+        datos_filtrados = datos_filtrados[
+            datos_filtrados['capacidad_total_wh'].between(rango_min_capacidad, rango_max_capacidad)
+        ]
+        logger.info(f"🔧 Filtro capacidad: {rango_min_capacidad:.1f}Wh - {rango_max_capacidad:.1f}Wh, quedan {len(datos_filtrados)}")
+
+    if datos_filtrados.empty:
+        logger.warning("❌ No hay resultados después del filtrado")
+        return pd.DataFrame()
+
+    # Ordenamiento por relevancia
+    if 'capacidad_total_wh' in datos_filtrados.columns:
+        datos_filtrados['diff_capacidad'] = abs(datos_filtrados['capacidad_total_wh'] - capacidad_requerida)
+    if 'voltaje_total_v' in datos_filtrados.columns:
+        datos_filtrados['diff_voltaje'] = abs(datos_filtrados['voltaje_total_v'] - voltaje)
+
+    columnas_orden = []
+    if 'diff_capacidad' in datos_filtrados.columns:
+        columnas_orden.append('diff_capacidad')
+    if 'diff_voltaje' in datos_filtrados.columns:
+        columnas_orden.append('diff_voltaje')
+
+    if columnas_orden:
+        res = datos_filtrados.sort_values(by=columnas_orden)
+    else:
+        res = datos_filtrados
+
+    # Limpiar columnas auxiliares
+    res = res.drop(columns=['diff_capacidad','diff_voltaje'] + [f"{c}_norm" for c in COLUMNAS_NORMALIZADAS], errors='ignore')
+
+    # Calcular capacidad individual
+    if 'voltaje_v' in res.columns and 'corriente_ah' in res.columns:
+        res['capacidad_individual_wh'] = res['voltaje_v'] * res['corriente_ah']
+
+    res = _ordenar_columnas(res)
+
+    logger.info(f"✅ Resultados finales: {len(res)} baterías/arreglos")
+    return res.reset_index(drop=True)
+
+# ---- Optimizador de bancos con varios modelos ----
+# Un banco son cadenas en paralelo; cada cadena tiene n_serie celdas de un mismo modelo y todas
+# las cadenas del banco comparten tipo y voltaje de celda. Combinando hasta max_modelos modelos
+# distintos se busca cubrir la capacidad requerida con el menor exceso y, a igual exceso, con
+# menos celdas y menos modelos. Los excesos dentro de TOLERANCIA_EXCESO_BANCO del objetivo
+# cuentan como iguales, así entre bancos que ya quedan "justos" decide el número de celdas;
+# por encima de la tolerancia el exceso se redondea a DECIMALES_EXCESO_BANCO para que el ruido
+# de punto flotante (2 x 18 + 4 x 7.2 frente a 9 x 7.2) no decida en lugar de las celdas.
+MAX_MODELOS_BANCO = 4
+MAX_CADENAS_BANCO = 32
+MAX_NODOS_BANCO = 200_000
+TOLERANCIA_EXCESO_BANCO = 0.01
+MAX_BANCOS = 5
+DECIMALES_EXCESO_BANCO = 6
+
+def _exceso_comparable(exceso, tolerancia):
+    exceso = round(exceso, DECIMALES_EXCESO_BANCO)
+    return exceso if exceso > tolerancia else 0
+
+def _limitar_modelos(valor):
+    valor = _try_float(valor)
+    return int(min(max(valor, 1), MAX_MODELOS_BANCO)) if valor == valor else 1
+
+# Candidatos del optimizador: una fila por (tipo, voltaje de celda, Ah) con voltaje y Ah
+# positivos, ordenadas por grupo y Ah de mayor a menor. Modelos con el mismo Ah son
+# intercambiables dentro del banco, así que se queda el primero del catálogo.
+def _candidatos_banco(datos):
+    datos = _expandir_numericos(datos)
+    if datos.empty or 'voltaje_v' not in datos.columns or 'corriente_ah' not in datos.columns:
+        return pd.DataFrame(columns=['tipo', 'voltaje', 'ah', 'fila'])
+
+    columna_tipo = 'tipo_norm' if 'tipo_norm' in datos.columns else 'tipo'
+    tipos = datos[columna_tipo].astype(object) if columna_tipo in datos.columns else pd.Series('', index=datos.index)
+    candidatos = pd.DataFrame({
+        'tipo': tipos.fillna('').astype(str).to_numpy(),
+        'voltaje': datos['voltaje_v'].to_numpy(dtype=np.float64),
+        'ah': datos['corriente_ah'].to_numpy(dtype=np.float64),
+        'fila': datos.index.to_numpy(),
+    })
+    candidatos = candidatos[(candidatos['voltaje'] > 0) & (candidatos['ah'] > 0)]
+    candidatos = candidatos.sort_values(['tipo', 'voltaje', 'ah', 'fila'], ascending=[True, True, False, True], kind='mergesort')
+    return candidatos.drop_duplicates(['tipo', 'voltaje', 'ah']).reset_index(drop=True)
+
+# Branch and bound sobre los Ah de un grupo (de mayor a menor). Cada nivel agrega un modelo y
+# cuántas cadenas lleva; el último modelo de la combinación lleva las cadenas justas para cubrir
+# lo que falta (ceil), así que esa cantidad no se enumera. Poda:
+#   - con modelos de Ah <= ahs[i] faltan al menos ceil(restante / ahs[i]) cadenas; si con eso se
+#     pasa de max_cadenas, o ya no se puede mejorar un banco "justo" en cadenas y modelos, ni
+#     este modelo ni los siguientes (de menos Ah) sirven;
+#   - al llegar a max_nodos se corta y el mejor banco encontrado se marca como no óptimo.
+# Devuelve ([(índice, cadenas), ...], completo).
+def _optimizar_grupo(ahs, ah_requerida, max_modelos, max_cadenas, tolerancia_ah, max_nodos):
+    mejor = {'clave': None, 'seleccion': None}
+    estado = {'nodos': 0, 'completo': True}
+
+    def explorar(inicio, restante, cadenas, seleccion):
+        for i in range(inicio, len(ahs)):
+            estado['nodos'] += 1
+            if estado['nodos'] > max_nodos:
+                estado['completo'] = False
+                return
+            ah = ahs[i]
+            minimo = max(1, ceil(restante / ah - 1e-9))
+            total = cadenas + minimo
+            if total > max_cadenas:
+                break
+            clave_mejor = mejor['clave']
+            if clave_mejor is not None and clave_mejor[0] == 0 and (total, len(seleccion) + 1) >= clave_mejor[1:]:
+                break
+
+            exceso = minimo * ah - restante
+            clave = (_exceso_comparable(exceso, tolerancia_ah), total, len(seleccion) + 1)
+            if clave_mejor is None or clave < clave_mejor:
+                mejor.update(clave=clave, seleccion=seleccion + [(i, minimo)])
+
+            if len(seleccion) + 1 < max_modelos:
+                for c in range(minimo - 1, 0, -1):
+                    explorar(i + 1, restante - c * ah, cadenas + c, seleccion + [(i, c)])
+                    if not estado['completo']:
+                        return
+
+    explorar(0, ah_requerida, 0, [])
+    return mejor['seleccion'], estado['completo']
+
+def _describir_banco(cat, grupo, seleccion, n_serie, capacidad_requerida, optimo):
+    columna_parte = next((c for c in COLUMNAS_NUMERO_PARTE if c in cat.columns), None)
+    columna_uso = _columna_aplicacion(cat)
+
+    def texto(fila, columna):
+        return str(fila[columna]) if columna and pd.notna(fila[columna]) else 'N/A'
+
+    modelos = []
+    for i, cadenas in seleccion:
+        fila = cat.loc[grupo['fila'].iat[i]]
+        modelos.append({
+            'numero_parte': texto(fila, columna_parte),
+            'aplicaciones': texto(fila, columna_uso),
+            'voltaje': float(grupo['voltaje'].iat[i]),
+            'corriente': float(grupo['ah'].iat[i]),
+            'n_paralelo': int(cadenas),
+            'n_celdas': int(cadenas * n_serie),
+        })
+
+    voltaje_celda = modelos[0]['voltaje']
+    voltaje_total = voltaje_celda * n_serie
+    corriente_total = sum(m['corriente'] * m['n_paralelo'] for m in modelos)
+    capacidad_total = voltaje_total * corriente_total
+    return {
+        'tipo': texto(cat.loc[grupo['fila'].iat[seleccion[0][0]]], 'tipo' if 'tipo' in cat.columns else None),
+        'voltaje_celda': voltaje_celda,
+        'n_serie': int(n_serie),
+        'voltaje_total': round(voltaje_total, 4),
+        'corriente_total': round(corriente_total, 4),
+        'capacidad_total': round(capacidad_total, 4),
+        'capacidad_requerida': round(capacidad_requerida, 4),
+        'exceso_wh': round(capacidad_total - capacidad_requerida, 4),
+        'n_celdas': sum(m['n_celdas'] for m in modelos),
+        'n_modelos': len(modelos),
+        'optimo': optimo,
+        'modelos': modelos,
+    }
+
+# Mejores bancos (uno por tipo y voltaje de celda, hasta MAX_BANCOS) para la capacidad requerida.
+# Usa las mismas etapas de tipo y aplicación que calcular_baterias (y su caché), y guarda en
+# caché los candidatos ya ordenados para las consultas que solo cambian voltaje o capacidad.
+def optimizar_bancos(cat: pd.DataFrame, voltaje=0, corriente=0, capacidad=0,
+                     tipo_bateria="", aplicacion="", autonomia_horas=0, potencia_carga=0,
+                     umbral_similitud=0.6, max_modelos=2, cache=None, version_catalogo=None):
+    capacidad_requerida, margen = _capacidad_y_margen(voltaje, corriente, capacidad, autonomia_horas, potencia_carga)
+    # inf o NaN (p. ej. capacidad_wh='inf') no tienen banco posible y romperían ceil
+    if cat.empty or not all(isfinite(x) for x in (capacidad_requerida, voltaje)) or capacidad_requerida <= 0:
+        return []
+
+    if cache is not None:
+        cache.sincronizar(version_catalogo)
+
+    clave_aplicacion, filas_aplicacion = _pipeline_filtros(cat, tipo_bateria, aplicacion, umbral_similitud, cache, version_catalogo)
+    candidatos = _etapa_con_cache(cache, version_catalogo, clave_aplicacion + (('banco',),), cat,
+                                  lambda: _candidatos_banco(filas_aplicacion()), guardar_ids=False)
+
+    max_modelos = _limitar_modelos(max_modelos)
+    bancos = []
+    for (_, voltaje_celda), grupo in candidatos.groupby(['tipo', 'voltaje'], sort=False):
+        n_serie = max(1, ceil(voltaje / voltaje_celda)) if voltaje > 0 else 1
+        voltaje_total = voltaje_celda * n_serie
+        if voltaje > 0 and not (voltaje * (1 - margen) <= voltaje_total <= voltaje * (1 + margen)):
+            continue
+
+        ah_requerida = capacidad_requerida / voltaje_total
+        seleccion, completo = _optimizar_grupo(grupo['ah'].to_numpy(), ah_requerida, max_modelos,
+                                               MAX_CADENAS_BANCO, TOLERANCIA_EXCESO_BANCO * ah_requerida, MAX_NODOS_BANCO)
+        if seleccion:
+            bancos.append(_describir_banco(cat, grupo, seleccion, n_serie, capacidad_requerida, completo))
+
+    tolerancia_wh = TOLERANCIA_EXCESO_BANCO * capacidad_requerida
+    bancos.sort(key=lambda b: (_exceso_comparable(b['exceso_wh'], tolerancia_wh), b['n_celdas'], b['n_modelos']))
+    logger.info(f"🔋 Bancos: {len(bancos)} grupos con solución para {capacidad_requerida}Wh (hasta {max_modelos} modelos)")
+    return bancos[:MAX_BANCOS]
+
+# ---- Costo estimado de una búsqueda (para control de admisión) ----
+# En ms de CPU de una petición /buscar completa, medidos con el test client sobre el catálogo
+# actual (263 filas, 106 términos de uso): con todas las etapas en caché cuesta ~1-32 ms según
+# cuántas filas quedan (armar la respuesta es lo dominante, ~0.12 ms por fila; se cuenta el
+# catálogo entero como cota); la coincidencia difusa de aplicación sin caché agrega ~13-20 ms
+# (por término distinto de las columnas de usos) y la etapa de arreglos sin caché ~5-10 ms (por
+# fila). La etapa de arreglos corre en toda búsqueda, con o sin permitir_arreglos. El
+# optimizador de bancos está acotado por MAX_NODOS_BANCO (~10-20 ms con 4 modelos).
+COSTO_BASE_MS = 1.0
+COSTO_FILA_MS = 0.12
+COSTO_TERMINO_DIFUSO_MS = 0.2
+COSTO_FILA_ARREGLOS_MS = 0.04
+COSTO_FILA_BANCO_MS = 0.02
+
+def _terminos_uso(cat):
+    columna = _columna_aplicacion(cat)
+    columnas = [f"{c}_norm" for c in [columna] + COLUMNAS_USO_ADICIONALES if c and f"{c}_norm" in cat.columns]
+    return sum(int(cat[c].nunique()) for c in columnas)
+
+# Parámetros de una búsqueda, con los mismos valores por defecto que el formulario
+@dataclass(frozen=True)
+class ConsultaBaterias:
+    tipo: str = ""
+    aplicacion: str = ""
+    voltaje: float = 0
+    corriente: float = 0
+    capacidad_wh: float = 0
+    autonomia_horas: float = 0
+    potencia_carga: float = 0
+    permitir_arreglos: bool = False
+    umbral_similitud: float = 0.6
+    optimizar_banco: bool = False
+    max_modelos: int = 2
+
+    # A partir del cuerpo JSON de /buscar (o de una línea de un registro de búsquedas)
+    @classmethod
+    def desde_dict(cls, data) -> "ConsultaBaterias":
+        return cls(
+            tipo=data.get('tipo', '').strip(),
+            aplicacion=data.get('aplicacion', '').strip(),
+            voltaje=_try_float(data.get('voltaje', 0)),
+            corriente=_try_float(data.get('corriente', 0)),
+            capacidad_wh=_try_float(data.get('capacidad_wh', 0)),
+            autonomia_horas=_try_float(data.get('autonomia_horas', 0)),
+            potencia_carga=_try_float(data.get('potencia_carga', 0)),
+            permitir_arreglos=_leer_bool(data.get('permitir_arreglos', False)),
+            optimizar_banco=_leer_bool(data.get('optimizar_banco', False)),
+            max_modelos=_limitar_modelos(data.get('max_modelos', 2)),
+        )
+
+    # Forma canónica: dos consultas con la misma forma devuelven lo mismo (tipo y aplicación
+    # se comparan normalizados en calcular_baterias)
+    def canonica(self) -> tuple:
+        return (
+            _norm(self.tipo) if self.tipo else None,
+            _norm_avanzada(self.aplicacion) if self.aplicacion else None,
+            self.voltaje,
+            self.corriente,
+            self.capacidad_wh,
+            self.autonomia_horas,
+            self.potencia_carga,
+            self.permitir_arreglos,
+            self.umbral_similitud,
+            self.max_modelos if self.optimizar_banco else None,
+        )
+
+    @property
+    def capacidad_calculada(self) -> Optional[float]:
+        if self.autonomia_horas and self.potencia_carga:
+            return self.autonomia_horas * self.potencia_carga
+        return None
+
+@dataclass
+class ResultadoBusqueda:
+    consulta: ConsultaBaterias
+    baterias: pd.DataFrame
+    version: Optional[tuple]
+    duracion_s: float
+    bancos: List[dict] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return len(self.baterias)
+
+    @property
+    def vacio(self) -> bool:
+        return self.baterias.empty
+
+# Motor de búsqueda: guarda el catálogo compacto en memoria (ya unido con db.json) y las cachés
+# por versión del catálogo: la de etapas del pipeline, la de respuestas de búsqueda y la de
+# facetas. La versión es ((mtime, tamaño) del Excel, (mtime, tamaño) de db.json): si cambia
+# cualquiera de los dos, la siguiente consulta rehace lo necesario (el Excel solo se vuelve a
+# leer si cambió él) y cada caché se vacía sola al sincronizarse con la nueva versión.
+# Las respuestas y facetas las arma quien llama (api3 les da forma JSON); el motor solo decide
+# cuándo se pueden reutilizar.
+class MotorBaterias:
+    def __init__(self, ruta_excel=RUTA_EXCEL, hoja="Baterias", ruta_db=RUTA_DB, cache_etapas_bytes=32 * 1024 * 1024,
+                 cache_resultados_bytes=16 * 1024 * 1024, cache_facetas_bytes=4 * 1024 * 1024):
+        self.ruta_excel = ruta_excel
+        self.hoja = hoja
+        self.ruta_db = ruta_db
+        self.cache_etapas = CacheVersionada(max_bytes=cache_etapas_bytes)
+        self.cache_resultados = CacheVersionada(max_bytes=cache_resultados_bytes)
+        self.cache_facetas = CacheVersionada(max_bytes=cache_facetas_bytes)
+        self._cat = pd.DataFrame()
+        self._version = None
+        self._base = (None, pd.DataFrame())  # (versión del Excel, catálogo antes de unir db.json)
+        self._lock = threading.Lock()
+
+    def version_actual(self):
+        version_excel = version_archivo(self.ruta_excel)
+        if version_excel is None:
+            return None
+        return (version_excel, version_archivo(self.ruta_db) if self.ruta_db else None)
+
+    def catalogo(self):
+        version = self.version_actual()
+        with self._lock:
+            if version is None or version != self._version:
+                version_excel = version[0] if version else None
+                if version_excel is None or version_excel != self._base[0]:
+                    base = cargar_catalogo_baterias(self.ruta_excel, hoja=self.hoja)
+                    # Si la lectura falla no se fija la versión, para reintentar en la siguiente consulta
+                    self._base = (version_excel if not base.empty else None, base)
+                    logger.info(f"📚 Catálogo cargado: {len(base)} baterías (versión {version_excel})")
+                cat = self._base[1]
+                if self.ruta_db and version[1] is not None:
+                    cat = unir_usos_db(cat, cargar_usos_db(self.ruta_db))
+                    if 'usos_db' in cat.columns:
+                        logger.info(f"🔗 Usos de db.json unidos: {int(cat['usos_db'].notna().sum())} de {len(cat)} baterías")
+                self._version = version if not cat.empty else None
+                self._cat = cat
+            return self._cat, self._version
+
+    # Costo estimado (ms de CPU) de buscar(consulta) con el estado actual de la caché de etapas
+    def costo_estimado(self, consulta: ConsultaBaterias) -> float:
+        cat, version = self.catalogo()
+        if cat.empty:
+            return COSTO_BASE_MS
+        self.cache_etapas.sincronizar(version)
+
+        filas = len(cat)
+        costo = COSTO_BASE_MS + filas * COSTO_FILA_MS
+        clave_aplicacion, _ = _pipeline_filtros(cat, consulta.tipo, consulta.aplicacion,
+                                                consulta.umbral_similitud, self.cache_etapas, version)
+        if clave_aplicacion[-1][1] is not None and not self.cache_etapas.contiene(clave_aplicacion, version):
+            costo += _terminos_uso(cat) * COSTO_TERMINO_DIFUSO_MS
+        clave_arreglos = _clave_arreglos(clave_aplicacion, consulta.permitir_arreglos,
+                                         consulta.voltaje, consulta.corriente)
+        if not self.cache_etapas.contiene(clave_arreglos, version):
+            costo += filas * COSTO_FILA_ARREGLOS_MS
+        if consulta.optimizar_banco:
+            costo += filas * consulta.max_modelos * COSTO_FILA_BANCO_MS
+        return costo
+
+    def buscar(self, consulta: ConsultaBaterias) -> ResultadoBusqueda:
+        inicio = time.perf_counter()
+        cat, version = self.catalogo()
+        baterias = calcular_baterias(
+            cat,
+            voltaje=consulta.voltaje,
+            corriente=consulta.corriente,
+            capacidad=consulta.capacidad_wh,
+            tipo_bateria=consulta.tipo,
+            aplicacion=consulta.aplicacion,
+            autonomia_horas=consulta.autonomia_horas,
+            potencia_carga=consulta.potencia_carga,
+            permitir_arreglos=consulta.permitir_arreglos,
+            umbral_similitud=consulta.umbral_similitud,
+            cache=self.cache_etapas,
+            version_catalogo=version,
+        )
+        bancos = []
+        if consulta.optimizar_banco:
+            bancos = optimizar_bancos(
+                cat,
+                voltaje=consulta.voltaje,
+                corriente=consulta.corriente,
+                capacidad=consulta.capacidad_wh,
+                tipo_bateria=consulta.tipo,
+                aplicacion=consulta.aplicacion,
+                autonomia_horas=consulta.autonomia_horas,
+                potencia_carga=consulta.potencia_carga,
+                umbral_similitud=consulta.umbral_similitud,
+                max_modelos=consulta.max_modelos,
+                cache=self.cache_etapas,
+                version_catalogo=version,
+            )
+        return ResultadoBusqueda(consulta, baterias, version, time.perf_counter() - inicio, bancos)
+
+    # Si la respuesta de la consulta ya está en la caché de resultados (no cuesta calcularla)
+    def respuesta_en_cache(self, consulta: ConsultaBaterias) -> bool:
+        _, version = self.catalogo()
+        # Se sincroniza antes, así una entrada de la versión anterior no cuenta como acierto
+        self.cache_resultados.sincronizar(version)
+        return self.cache_resultados.contiene(consulta.canonica(), version)
+
+    # Respuesta de la consulta desde la caché de resultados o, si no está, armada con
+    # construir(resultado) sobre buscar(consulta) y guardada con la versión de ese resultado
+    def respuesta(self, consulta: ConsultaBaterias, construir):
+        _, version = self.catalogo()
+        self.cache_resultados.sincronizar(version)
+        clave = consulta.canonica()
+        respuesta = self.cache_resultados.obtener(clave, version)
+        if respuesta is not None:
+            logger.info(f"♻️ Respuesta desde caché: {clave}")
+            return respuesta
+        resultado = self.buscar(consulta)
+        respuesta = construir(resultado)
+        self.cache_resultados.guardar(clave, respuesta, resultado.version)
+        return respuesta
+
+    # Faceta del catálogo (tipos, aplicaciones, voltajes...) construida una vez por versión con
+    # construir(cat) o, si se filtra por tipo, construir(cat, tipo_bateria)
+    def faceta(self, nombre, construir, tipo_bateria=None):
+        cat, version = self.catalogo()
+        self.cache_facetas.sincronizar(version)
+        clave = (nombre, _norm(tipo_bateria) if tipo_bateria else None)
+        respuesta = self.cache_facetas.obtener(clave, version)
+        if respuesta is None:
+            respuesta = construir(cat) if tipo_bateria is None else construir(cat, tipo_bateria)
+            if not cat.empty:
+                self.cache_facetas.guardar(clave, respuesta, version)
+        return respuesta
+
+    def estadisticas(self):
+        return {
+            'ruta_excel': self.ruta_excel,
+            'version_catalogo': list(self._version) if self._version else None,
+            'filas': len(self._cat),
+            'cache_etapas': self.cache_etapas.estadisticas(),
+            'cache_resultados': self.cache_resultados.estadisticas(),
+            'cache_facetas': self.cache_facetas.estadisticas(),
+        }
+
+# Utilidades del motor que usan api3.py y calc11.py, con nombre público
+leer_numero = _try_float
+normalizar_texto = _norm
+normalizar_uso = _norm_avanzada
+a_float64 = _a_float64
+buscar_columna_aplicacion = _columna_aplicacion
+limitar_modelos = _limitar_modelos
@@ -0,0 +1,353 @@
+import os
+import glob
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from motor_baterias import (
+    RUTA_EXCEL,
+    RUTA_DB,
+    COLUMNAS_APLICACION,
+    COLUMNAS_USO_ADICIONALES,
+    _norm,
+    _norm_avanzada,
+    _buscar_coincidencias_norm,
+    _a_float64,
+    _expandir_numericos,
+    _capacidad_y_margen,
+    _configuracion_arreglos,
+    _ordenar_columnas,
+    cargar_catalogo_baterias,
+    cargar_usos_db,
+    unir_usos_db,
+    compactar_catalogo,
+    COLUMNAS_NORMALIZADAS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Motor de búsqueda particionado para catálogos grandes (varios proveedores, millones de filas).
+# Aplica las mismas reglas que calcular_baterias (tipo, aplicación, arreglos, rangos y orden),
+# pero sobre arreglos numpy divididos en particiones que se procesan en un pool de hilos o de
+# procesos. Cada partición devuelve su top-K y al final se mezclan en un ranking global.
+# Con procesos los arreglos numéricos viven en memoria compartida (multiprocessing.shared_memory):
+# cada trabajador los mapea sin copiarlos. Con hilos se comparten directamente, pero la etapa de
+# aplicación (comparación difusa en Python puro) queda serializada por el GIL; solo las etapas
+# numpy escalan con los núcleos, así que para catálogos con muchos usos conviene 'procesos'.
+
+TAM_PARTICION = 50_000
+TAM_BLOQUE_DICCIONARIO = 256
+
+# Se cargan varios libros/hojas con el mismo formato que la hoja "Baterias".
+# rutas puede mezclar archivos .xlsx y carpetas; con hoja=None se leen todas las hojas del libro.
+# Con ruta_db se unen los usos de db.json, igual que en MotorBaterias, para que la etapa de
+# aplicación busque en las mismas fuentes que calcular_baterias.
+def cargar_catalogos(rutas, hoja="Baterias", ruta_db=RUTA_DB):
+    if isinstance(rutas, str):
+        rutas = [rutas]
+
+    archivos = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            archivos.extend(sorted(glob.glob(os.path.join(ruta, "*.xlsx"))))
+        else:
+            archivos.append(ruta)
+
+    partes = []
+    for archivo in archivos:
+        try:
+            libro = pd.ExcelFile(archivo)
+        except Exception as e:
+            logger.error(f"[ERROR] No se pudo abrir el archivo '{archivo}': {e}")
+            continue
+        hojas = libro.sheet_names if hoja is None else [h for h in libro.sheet_names if h == hoja]
+        for nombre_hoja in hojas:
+            df = cargar_catalogo_baterias(libro, hoja=nombre_hoja)
+            if df.empty or 'voltaje_v' not in df.columns or 'corriente_ah' not in df.columns:
+                continue
+            df['origen'] = f"{os.path.basename(archivo)}:{nombre_hoja}"
+            partes.append(df)
+
+    if not partes:
+        return pd.DataFrame()
+
+    # Al concatenar, las categorías de cada hoja se vuelven texto; se compacta de nuevo
+    # para tener un solo diccionario por columna en todo el catálogo
+    cat = pd.concat(partes, ignore_index=True)
+    if ruta_db:
+        cat = unir_usos_db(cat, cargar_usos_db(ruta_db))
+    return compactar_catalogo(cat)
+
+# Arreglos del catálogo que necesita cada partición. En cada proceso se llenan una vez (en el
+# initializer del pool) con vistas sobre la memoria compartida; entre hilos se pasan directamente.
+ARREGLOS_COMPARTIDOS = ('voltaje', 'corriente', 'tipo', 'uso')
+_ARREGLOS = {}
+_SEGMENTOS = []  # los segmentos abiertos deben seguir vivos mientras existan las vistas
+
+# descriptores: {nombre: (segmento, forma, dtype)}. El diccionario de usos es pequeño (una
+# entrada por combinación distinta de usos) y se envía tal cual.
+def _inicializar_trabajador(descriptores, usos):
+    _ARREGLOS.clear()
+    _SEGMENTOS.clear()
+    for nombre, (segmento, forma, dtype) in descriptores.items():
+        memoria = shared_memory.SharedMemory(name=segmento)
+        _SEGMENTOS.append(memoria)
+        _ARREGLOS[nombre] = np.ndarray(forma, dtype=dtype, buffer=memoria.buf)
+    _ARREGLOS['usos'] = usos
+
+# Etapa de aplicación: comparación difusa de un bloque del diccionario de usos normalizados.
+# Cada entrada es una tupla con los usos de cada fuente (Excel, db.json); basta con que coincida una.
+def _coincidencias_bloque(inicio, fin, busqueda_norm, umbral, arreglos=None):
+    usos = (arreglos or _ARREGLOS)['usos']
+    return [any(_buscar_coincidencias_norm(u, busqueda_norm, umbral) for u in fuentes) for fuentes in usos[inicio:fin]]
+
+# Etapas de tipo, arreglos y rangos para las filas [inicio, fin). Devuelve el top-K de la
+# partición ordenado igual que calcular_baterias: diferencia de capacidad, de voltaje y
+# después posición en el catálogo.
+def _procesar_particion(inicio, fin, tipo_codigo, mascara_usos, parametros, top_k, arreglos=None):
+    arreglos = arreglos or _ARREGLOS
+    v = arreglos['voltaje'][inicio:fin]
+    a = arreglos['corriente'][inicio:fin]
+    filas = np.arange(inicio, fin)
+    mascara = np.ones(fin - inicio, dtype=bool)
+
+    if tipo_codigo is not None:
+        mascara &= arreglos['tipo'][inicio:fin] == tipo_codigo
+    if mascara_usos is not None:
+        mascara &= mascara_usos[arreglos['uso'][inicio:fin]]
+
+    voltaje = parametros['voltaje']
+    corriente = parametros['corriente']
+    capacidad_requerida = parametros['capacidad_requerida']
+    margen = parametros['margen']
+
+    validas, n_serie, n_paralelo = _configuracion_arreglos(v, a, voltaje, corriente, parametros['permitir_arreglos'])
+    mascara &= validas
+
+    voltaje_total = v * n_serie
+    corriente_total = a * n_paralelo
+    capacidad_total = voltaje_total * corriente_total
+
+    for objetivo, valores in ((voltaje, voltaje_total), (corriente, corriente_total),
+                              (capacidad_requerida, capacidad_total)):
+        if objetivo > 0:
+            mascara &= (valores >= objetivo * (1 - margen)) & (valores <= objetivo * (1 + margen))
+
+    seleccion = np.flatnonzero(mascara)
+    diff_capacidad = np.abs(capacidad_total[seleccion] - capacidad_requerida)
+    diff_voltaje = np.abs(voltaje_total[seleccion] - voltaje)
+    # NaN al final, como sort_values
+    diff_capacidad = np.where(np.isnan(diff_capacidad), np.inf, diff_capacidad)
+    diff_voltaje = np.where(np.isnan(diff_voltaje), np.inf, diff_voltaje)
+
+    orden = np.lexsort((filas[seleccion], diff_voltaje, diff_capacidad))
+    if top_k is not None:
+        orden = orden[:top_k]
+    seleccion = seleccion[orden]
+
+    return {
+        'fila': filas[seleccion],
+        'n_serie': n_serie[seleccion].astype(np.int64),
+        'n_paralelo': n_paralelo[seleccion].astype(np.int64),
+        'voltaje_total_v': voltaje_total[seleccion],
+        'corriente_total_ah': corriente_total[seleccion],
+        'capacidad_total_wh': capacidad_total[seleccion],
+        'diff_capacidad': diff_capacidad[orden],
+        'diff_voltaje': diff_voltaje[orden],
+    }
+
+class CatalogoParticionado:
+    # ejecutor: 'hilos' o 'procesos'. Con procesos los arreglos se copian una sola vez a memoria
+    # compartida al crear el pool; las tareas solo llevan rangos de filas y parámetros.
+    def __init__(self, cat: pd.DataFrame, tam_particion=TAM_PARTICION, n_trabajadores=None, ejecutor='hilos'):
+        if any(dtype == object for dtype in cat.dtypes):
+            cat = compactar_catalogo(cat)
+        self.cat = cat
+        self.tam_particion = max(1, int(tam_particion))
+        self.n_trabajadores = n_trabajadores or os.cpu_count() or 1
+        self.ejecutor = ejecutor
+        self._pool = None
+        self._segmentos = []
+
+        self.columna_aplicacion = next((c for c in COLUMNAS_APLICACION if c in cat.columns), None)
+        self.arreglos = self._construir_arreglos()
+        n = len(cat)
+        self.particiones = [(i, min(i + self.tam_particion, n)) for i in range(0, n, self.tam_particion)]
+
+    def _construir_arreglos(self):
+        cat = self.cat
+        n = len(cat)
+        arreglos = {
+            'voltaje': _a_float64(cat['voltaje_v'].to_numpy()).astype(np.float64) if 'voltaje_v' in cat.columns else np.zeros(n),
+            'corriente': _a_float64(cat['corriente_ah'].to_numpy()).astype(np.float64) if 'corriente_ah' in cat.columns else np.zeros(n),
+            'tipo': np.full(n, -1, dtype=np.int32),
+            'uso': np.full(n, -1, dtype=np.int32),
+            'usos': [],
+        }
+        self.tipos = {}
+        if 'tipo_norm' in cat.columns:
+            arreglos['tipo'] = cat['tipo_norm'].cat.codes.to_numpy().astype(np.int32)
+            self.tipos = {t: i for i, t in enumerate(cat['tipo_norm'].cat.categories)}
+        if self.columna_aplicacion:
+            # El diccionario de usos es de combinaciones (uso del Excel, usos adicionales) que
+            # aparecen en el catálogo, así la comparación difusa sigue siendo una por entrada
+            columnas = [f"{c}_norm" for c in [self.columna_aplicacion] + COLUMNAS_USO_ADICIONALES
+                        if f"{c}_norm" in cat.columns]
+            codigos = np.stack([cat[c].cat.codes.to_numpy() for c in columnas], axis=1)
+            combinaciones, inverso = np.unique(codigos, axis=0, return_inverse=True)
+            categorias = [list(cat[c].cat.categories) + [''] for c in columnas]  # -1 -> ''
+            arreglos['uso'] = inverso.reshape(-1).astype(np.int32)
+            arreglos['usos'] = [tuple(categorias[j][k] for j, k in enumerate(fila)) for fila in combinaciones]
+        return arreglos
+
+    # Copia los arreglos numéricos a segmentos de memoria compartida y devuelve sus descriptores
+    def _compartir_arreglos(self):
+        descriptores = {}
+        for nombre in ARREGLOS_COMPARTIDOS:
+            arreglo = self.arreglos[nombre]
+            memoria = shared_memory.SharedMemory(create=True, size=max(1, arreglo.nbytes))
+            self._segmentos.append(memoria)
+            np.ndarray(arreglo.shape, dtype=arreglo.dtype, buffer=memoria.buf)[:] = arreglo
+            descriptores[nombre] = (memoria.name, arreglo.shape, arreglo.dtype.str)
+        return descriptores
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            if self.ejecutor == 'procesos':
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.n_trabajadores,
+                    initializer=_inicializar_trabajador,
+                    initargs=(self._compartir_arreglos(), self.arreglos['usos']),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.n_trabajadores)
+        return self._pool
+
+    def _enviar(self, funcion, *args):
+        if self.ejecutor == 'procesos':
+            return self._obtener_pool().submit(funcion, *args)
+        return self._obtener_pool().submit(funcion, *args, arreglos=self.arreglos)
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for memoria in self._segmentos:
+            memoria.close()
+            memoria.unlink()
+        self._segmentos = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    # Etapa de aplicación repartida por bloques del diccionario de usos. Devuelve una máscara
+    # por categoría con un False extra al final para el código -1.
+    def _mascara_usos(self, aplicacion, umbral):
+        usos = self.arreglos['usos']
+        busqueda_norm = _norm_avanzada(aplicacion)
+        bloques = [(i, min(i + TAM_BLOQUE_DICCIONARIO, len(usos))) for i in range(0, len(usos), TAM_BLOQUE_DICCIONARIO)]
+        futuros = [self._enviar(_coincidencias_bloque, i, f, busqueda_norm, umbral) for i, f in bloques]
+        coincide = [c for futuro in futuros for c in futuro.result()]
+        return np.array(coincide + [False], dtype=bool)
+
+    def buscar(self, voltaje=0, corriente=0, capacidad=0, tipo_bateria="", aplicacion="",
+               autonomia_horas=0, potencia_carga=0, permitir_arreglos=False, umbral_similitud=0.6, top_k=None):
+        if self.cat.empty:
+            return pd.DataFrame()
+
+        tipo_codigo = None
+        if tipo_bateria and 'tipo' in self.cat.columns:
+            tipo_codigo = self.tipos.get(_norm(tipo_bateria))
+            if tipo_codigo is None:
+                return pd.DataFrame()
+
+        mascara_usos = None
+        if aplicacion and aplicacion.strip() and self.columna_aplicacion:
+            mascara_usos = self._mascara_usos(aplicacion, umbral_similitud)
+
+        # Capacidad requerida y margen, con las mismas reglas que calcular_baterias
+        capacidad_requerida, margen = _capacidad_y_margen(voltaje, corriente, capacidad, autonomia_horas, potencia_carga)
+        parametros = {
+            'voltaje': voltaje,
+            'corriente': corriente,
+            'capacidad_requerida': capacidad_requerida,
+            'margen': margen,
+            'permitir_arreglos': permitir_arreglos,
+        }
+
+        futuros = [
+            self._enviar(_procesar_particion, inicio, fin, tipo_codigo, mascara_usos, parametros, top_k)
+            for inicio, fin in self.particiones
+        ]
+        parciales = [futuro.result() for futuro in futuros]
+        return self._mezclar(parciales, top_k)
+
+    # Mezcla los top-K de cada partición en el ranking global y arma el DataFrame de salida
+    def _mezclar(self, parciales, top_k):
+        combinado = {k: np.concatenate([p[k] for p in parciales]) for k in parciales[0]}
+        if len(combinado['fila']) == 0:
+            return pd.DataFrame()
+
+        orden = np.lexsort((combinado['fila'], combinado['diff_voltaje'], combinado['diff_capacidad']))
+        if top_k is not None:
+            orden = orden[:top_k]
+
+        res = _expandir_numericos(self.cat.iloc[combinado['fila'][orden]])
+        res = res.drop(columns=[f"{c}_norm" for c in COLUMNAS_NORMALIZADAS], errors='ignore')
+        if 'capacidad_bateria_wh' not in res.columns and 'voltaje_v' in res.columns and 'corriente_ah' in res.columns:
+            res['capacidad_bateria_wh'] = res['voltaje_v'] * res['corriente_ah']
+        for col in ['n_serie', 'n_paralelo', 'voltaje_total_v', 'corriente_total_ah', 'capacidad_total_wh']:
+            res[col] = combinado[col][orden]
+        res['es_arreglo'] = (res['n_serie'] > 1) | (res['n_paralelo'] > 1)
+        if 'voltaje_v' in res.columns and 'corriente_ah' in res.columns:
+            res['capacidad_individual_wh'] = res['voltaje_v'] * res['corriente_ah']
+
+        return _ordenar_columnas(res).reset_index(drop=True)
+
+def main_particionado():
+    parser = argparse.ArgumentParser(description="Búsqueda particionada sobre uno o varios catálogos de baterías")
+    parser.add_argument("rutas", nargs="*", default=[RUTA_EXCEL], help="Archivos .xlsx o carpetas con catálogos")
+    parser.add_argument("--hoja", default="Baterias", help="Hoja a leer; use '*' para todas las hojas")
+    parser.add_argument("--db", default=RUTA_DB, help="db.json con usos por número de parte; vacío para no usarlo")
+    parser.add_argument("--tipo", default="")
+    parser.add_argument("--aplicacion", default="")
+    parser.add_argument("--voltaje", type=float, default=0)
+    parser.add_argument("--corriente", type=float, default=0)
+    parser.add_argument("--capacidad", type=float, default=0)
+    parser.add_argument("--arreglos", action="store_true")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--trabajadores", type=int, default=None)
+    parser.add_argument("--particion", type=int, default=TAM_PARTICION)
+    parser.add_argument("--ejecutor", choices=["hilos", "procesos"], default="procesos")
+    args = parser.parse_args()
+
+    cat = cargar_catalogos(args.rutas, hoja=None if args.hoja == "*" else args.hoja, ruta_db=args.db)
+    if cat.empty:
+        print("[ERROR] No se pudieron cargar datos de los catálogos.")
+        return
+
+    with CatalogoParticionado(cat, tam_particion=args.particion, n_trabajadores=args.trabajadores,
+                              ejecutor=args.ejecutor) as motor:
+        inicio = time.perf_counter()
+        res = motor.buscar(voltaje=args.voltaje, corriente=args.corriente, capacidad=args.capacidad,
+                           tipo_bateria=args.tipo, aplicacion=args.aplicacion,
+                           permitir_arreglos=args.arreglos, top_k=args.top)
+        duracion = time.perf_counter() - inicio
+
+    print(f"🔧 {len(cat)} filas en {len(motor.particiones)} particiones, {motor.n_trabajadores} trabajadores ({args.ejecutor}): {duracion*1000:.1f} ms")
+    if res.empty:
+        print("No se encontraron baterías que coincidan con los criterios especificados.")
+        return
+    columnas_mostrar = ['tipo','no_de_parte','no._de_parte','voltaje_v','corriente_ah','n_serie','n_paralelo','voltaje_total_v','capacidad_total_wh','origen']
+    print(res[[c for c in columnas_mostrar if c in res.columns]].to_string(index=False))
+
+if __name__ == "__main__":
+    main_particionado()
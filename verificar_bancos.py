@@ -0,0 +1,84 @@
+import argparse
+import itertools
+import logging
+import random
+import sys
+
+from motor_baterias import _exceso_comparable, _optimizar_grupo
+
+# Comprobación del optimizador de bancos: compara _optimizar_grupo (branch and bound con poda)
+# contra una enumeración exhaustiva de todas las combinaciones de modelos y cadenas en casos
+# aleatorios pequeños. Es la prueba de que las reglas de poda no descartan el mejor banco;
+# conviene correrla después de tocar _optimizar_grupo o _exceso_comparable.
+#
+# Ejemplo:
+#   python verificar_bancos.py --casos 600 --semilla 1
+AHS_CATALOGO = [1.2, 2.3, 4.5, 5, 7, 7.2, 9, 12, 17, 18, 26, 33, 40, 55, 65, 75, 100, 120, 150, 200]
+
+
+# Mejor clave (exceso comparable, cadenas, modelos) probando todas las combinaciones de hasta
+# max_modelos modelos con 1..max_cadenas cadenas cada uno; None si nada cubre lo requerido
+def mejor_exhaustivo(ahs, ah_requerida, max_modelos, max_cadenas, tolerancia_ah):
+    mejor = None
+
+    def recorrer(combinacion, cadenas):
+        nonlocal mejor
+        if len(cadenas) == len(combinacion):
+            capacidad = sum(ahs[i] * c for i, c in zip(combinacion, cadenas))
+            if capacidad < ah_requerida - 1e-9:
+                return
+            clave = (_exceso_comparable(capacidad - ah_requerida, tolerancia_ah), sum(cadenas), len(combinacion))
+            if mejor is None or clave < mejor:
+                mejor = clave
+            return
+        for c in range(1, max_cadenas - sum(cadenas) + 1):
+            recorrer(combinacion, cadenas + [c])
+
+    for k in range(1, max_modelos + 1):
+        for combinacion in itertools.combinations(range(len(ahs)), k):
+            recorrer(combinacion, [])
+    return mejor
+
+
+def clave_seleccion(ahs, ah_requerida, seleccion, tolerancia_ah):
+    if not seleccion:
+        return None
+    capacidad = sum(ahs[i] * c for i, c in seleccion)
+    return (_exceso_comparable(capacidad - ah_requerida, tolerancia_ah), sum(c for _, c in seleccion), len(seleccion))
+
+
+def verificar(casos, semilla, max_cadenas):
+    rnd = random.Random(semilla)
+    distintos = []
+    for _ in range(casos):
+        ahs = sorted({rnd.choice(AHS_CATALOGO) for _ in range(rnd.randint(1, 6))}, reverse=True)
+        ah_requerida = rnd.uniform(1, 400)
+        max_modelos = rnd.randint(1, 3)
+        tolerancia_ah = 0.01 * ah_requerida
+
+        seleccion, completo = _optimizar_grupo(ahs, ah_requerida, max_modelos, max_cadenas, tolerancia_ah, 10**7)
+        obtenida = clave_seleccion(ahs, ah_requerida, seleccion, tolerancia_ah)
+        esperada = mejor_exhaustivo(ahs, ah_requerida, max_modelos, max_cadenas, tolerancia_ah)
+        if not completo or obtenida != esperada:
+            distintos.append((ahs, ah_requerida, max_modelos, seleccion, obtenida, esperada))
+    return distintos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el optimizador de bancos con una búsqueda exhaustiva")
+    parser.add_argument("--casos", type=int, default=600)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--max-cadenas", type=int, default=12)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    distintos = verificar(args.casos, args.semilla, args.max_cadenas)
+    for ahs, ah_requerida, max_modelos, seleccion, obtenida, esperada in distintos[:10]:
+        print(f"[ERROR] ahs={ahs} requerida={ah_requerida:.4f} modelos={max_modelos}: "
+              f"{seleccion} -> {obtenida}, exhaustivo {esperada}")
+    print(f"🔋 {args.casos} casos, {len(distintos)} distintos")
+    sys.exit(1 if distintos else 0)
+
+
+if __name__ == "__main__":
+    main()